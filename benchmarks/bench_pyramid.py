@@ -0,0 +1,69 @@
+import os
+import sys
+import glob
+import time
+import argparse
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from capture import Frame
+from templates import template_registry
+from vision import match_template, match_template_pyramid
+
+# --- Comparaison recherche pleine résolution / pyramidale sur des captures enregistrées ---
+# Usage : python benchmarks/bench_pyramid.py <dossier_de_captures> [--template button_ready] [--repeat 20]
+
+def time_matcher(matcher, template, frame_image, gray, repeat):
+    durations = []
+    result = None
+    for i in range(repeat):
+        # Nouvelle capture à chaque essai : les niveaux de pyramide ne sont pas mis en cache d'un essai à l'autre
+        frame = Frame(i, time.time(), frame_image, (0, 0, frame_image.width, frame_image.height))
+        frame._gray = gray
+        start = time.perf_counter()
+        result = matcher(template, 0.8, frame=frame)
+        durations.append(time.perf_counter() - start)
+    return result, np.array(durations) * 1000
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("frames_dir")
+    parser.add_argument("--template", default="button_ready")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    template = template_registry.get(args.template)
+    if template is None:
+        print(f"Modèle '{args.template}' introuvable dans Images/.")
+        return 1
+
+    paths = sorted(glob.glob(os.path.join(args.frames_dir, "**", "*.png"), recursive=True))
+    if not paths:
+        print(f"Aucune capture trouvée dans {args.frames_dir}.")
+        return 1
+
+    full_times, pyramid_times, mismatches = [], [], 0
+    for path in paths:
+        frame_image = Image.open(path).convert("RGB")
+        gray = Frame(0, 0, frame_image, (0, 0, frame_image.width, frame_image.height)).gray
+        full_result, full_ms = time_matcher(match_template, template, frame_image, gray, args.repeat)
+        pyramid_result, pyramid_ms = time_matcher(match_template_pyramid, template, frame_image, gray, args.repeat)
+        same = (full_result is None and pyramid_result is None) or \
+               (full_result is not None and pyramid_result is not None and full_result[:2] == pyramid_result[:2])
+        mismatches += 0 if same else 1
+        full_times.append(np.median(full_ms))
+        pyramid_times.append(np.median(pyramid_ms))
+        print(f"{os.path.basename(path):40s} plein: {np.median(full_ms):7.2f} ms  pyramide: {np.median(pyramid_ms):7.2f} ms  "
+              f"{'OK' if same else f'DIFFÉRENT ({full_result} / {pyramid_result})'}")
+
+    full_median, pyramid_median = np.median(full_times), np.median(pyramid_times)
+    print(f"\n{len(paths)} captures, modèle '{args.template}'.")
+    print(f"Médiane plein écran : {full_median:.2f} ms, pyramide : {pyramid_median:.2f} ms, gain x{full_median / pyramid_median:.1f}.")
+    print(f"Résultats différents : {mismatches}.")
+    return 0 if mismatches == 0 else 2
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,197 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from capture import Frame, ReplayScreenSource, frame_bus
+from templates import template_registry
+import vision
+
+# --- Banc d'essai des détecteurs sur un corpus de captures enregistrées ---
+# Corpus : <corpus>/fishing, <corpus>/placement, <corpus>/combat (dossiers ou archives .zip, voir ReplayScreenSource)
+# Usage : python benchmarks/bench_vision.py <corpus> [--repeat 20] [--output resultats.json] [--compare precedent.json]
+# Les allocations sont mesurées avec tracemalloc (mémoire Python et NumPy, pas les tampons internes d'OpenCV).
+
+GAME_AREA = (0, 24, 1348, 808)
+SCENES = ("fishing", "placement", "combat")
+
+def find_scene(corpus, scene):
+    for path in (os.path.join(corpus, scene), os.path.join(corpus, f"{scene}.zip")):
+        if os.path.exists(path):
+            return path
+    return None
+
+def load_scene(path):
+    try:
+        source = ReplayScreenSource(path, loop=False)
+    except ValueError:
+        return []
+    return [source.grab()[0] for _ in range(len(source.frames))]
+
+def make_frame(image, frame_id, bbox=None):
+    # Nouvelle capture à chaque appel : aucun cache (gris, pyramide) n'est partagé d'une mesure à l'autre
+    frame = Frame(frame_id, time.time(), image, (0, 0, image.width, image.height))
+    return frame.crop(bbox) if bbox else frame
+
+def build_targets():
+    # (nom, scène, fonction(image, id)) ; une cible dont le module ne s'importe pas est signalée indisponible
+    targets, unavailable = [], {}
+
+    try:
+        import utils
+        ok_template = template_registry.get("button_ok")
+        close_template = template_registry.get("button_X")
+        targets += [
+            ("get_map_coordinates_single_pass", "fishing", lambda image, i: utils.get_map_coordinates_single_pass(frame=make_frame(image, i))),
+            ("is_fight_started", "fishing", lambda image, i: utils.is_fight_started(checks=1, frame=make_frame(image, i), pyramid=True)),
+            # Partie détection des popups uniquement : les fonctions utils cliquent quand le bouton est trouvé
+            ("check_and_close_levelup_popup", "fishing", lambda image, i: vision.locate_template(ok_template, 0.8, frame=make_frame(image, i))),
+            ("check_and_close_fight_end_popup", "combat", lambda image, i: vision.locate_template(close_template, 0.8, frame=make_frame(image, i))),
+        ]
+    except Exception as e:
+        for name in ("get_map_coordinates_single_pass", "is_fight_started", "check_and_close_levelup_popup", "check_and_close_fight_end_popup"):
+            unavailable[name] = f"{type(e).__name__}: {e}"
+
+    try:
+        import fight
+        from grid import grid_instance
+        targets += [
+            ("Grid.map_obstacles", "combat", lambda image, i: grid_instance.map_obstacles(frame=make_frame(image, i, GAME_AREA))),
+            ("find_entities_by_image[enemy]", "combat", lambda image, i: fight.find_entities_by_image(
+                fight.ENEMY_TEMPLATES, make_frame(image, i, GAME_AREA), {}, y_compensation_factor=1.5, exclude_rect=(1190, 671, 1275, 701))),
+            ("find_entities_by_image[ally]", "combat", lambda image, i: fight.find_entities_by_image(
+                fight.ALLY_TEMPLATES, make_frame(image, i, GAME_AREA), {}, y_compensation_factor=1.8)),
+            ("find_cells_by_color", "placement", lambda image, i: fight.find_cells_by_color(
+                fight.PLAYER_START_CELL_COLOR_RGB, tolerance=50, min_area=200, bbox=GAME_AREA, frame=make_frame(image, i))),
+        ]
+    except Exception as e:
+        for name in ("Grid.map_obstacles", "find_entities_by_image[enemy]", "find_entities_by_image[ally]", "find_cells_by_color"):
+            unavailable[name] = f"{type(e).__name__}: {e}"
+
+    return targets, unavailable
+
+def measure(function, images, repeat, warmup):
+    for i, image in enumerate(images[:1] * warmup):
+        function(image, -1 - i)
+
+    durations = []
+    for n in range(repeat):
+        for i, image in enumerate(images):
+            start = time.perf_counter()
+            function(image, n * len(images) + i)
+            durations.append(time.perf_counter() - start)
+
+    # Deuxième passe sous tracemalloc : le traçage fausse les temps, on ne garde que la mémoire
+    allocated, peaks = [], []
+    tracemalloc.start()
+    for i, image in enumerate(images):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        function(image, i)
+        current, peak = tracemalloc.get_traced_memory()
+        allocated.append(current - before)
+        peaks.append(peak - before)
+    tracemalloc.stop()
+
+    durations = np.array(durations) * 1000
+    return {
+        "calls": len(durations),
+        "p50_ms": round(float(np.percentile(durations, 50)), 3),
+        "p95_ms": round(float(np.percentile(durations, 95)), 3),
+        "mean_ms": round(float(durations.mean()), 3),
+        "alloc_peak_kb": round(float(np.median(peaks)) / 1024, 1),
+        "alloc_retained_kb": round(float(np.median(allocated)) / 1024, 1),
+    }
+
+def print_comparison(results, previous, previous_path):
+    print(f"\nComparaison avec {previous_path} :")
+    for name, result in results.items():
+        old = previous.get(name)
+        if "p50_ms" not in result or not old or "p50_ms" not in old:
+            continue
+        delta = (result["p50_ms"] - old["p50_ms"]) / old["p50_ms"] * 100 if old["p50_ms"] else 0.0
+        print(f"{name:36s} p50 {old['p50_ms']:8.2f} -> {result['p50_ms']:8.2f} ms ({delta:+.1f} %)  "
+              f"p95 {old['p95_ms']:8.2f} -> {result['p95_ms']:8.2f} ms")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("corpus")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--compare", default=None)
+    args = parser.parse_args()
+
+    scene_paths = {scene: find_scene(args.corpus, scene) for scene in SCENES}
+    scenes = {scene: load_scene(path) if path else [] for scene, path in scene_paths.items()}
+    if not any(scenes.values()):
+        print(f"Aucune capture trouvée dans {args.corpus} ({', '.join(SCENES)}).")
+        return 1
+
+    # Les détecteurs ne doivent ni voir l'écran réel ni réécrire config.json
+    frame_bus.set_source(ReplayScreenSource(next(scene_paths[s] for s in SCENES if scenes[s])))
+    temp_dir = tempfile.mkdtemp()
+    temp_config = os.path.join(temp_dir, "config.json")
+    if os.path.exists(vision.CONFIG_PATH):
+        shutil.copy(vision.CONFIG_PATH, temp_config)
+    vision.learned_positions.config_path = temp_config
+
+    previous = None
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            previous = json.load(f).get("results", {})
+
+    targets, unavailable = build_targets()
+    results = {name: {"status": "indisponible", "reason": reason} for name, reason in unavailable.items()}
+    for name, scene, function in targets:
+        images = scenes[scene]
+        if not images:
+            results[name] = {"status": "ignorée", "reason": f"aucune capture '{scene}'"}
+            continue
+        try:
+            results[name] = {"status": "ok", "scene": scene, "frames": len(images)}
+            results[name].update(measure(function, images, args.repeat, args.warmup))
+        except Exception as e:
+            results[name] = {"status": "erreur", "reason": f"{type(e).__name__}: {e}"}
+
+    print(f"{'Cible':36s} {'p50 (ms)':>9s} {'p95 (ms)':>9s} {'pic (Ko)':>9s}")
+    for name, result in results.items():
+        if result["status"] == "ok":
+            print(f"{name:36s} {result['p50_ms']:9.2f} {result['p95_ms']:9.2f} {result['alloc_peak_kb']:9.1f}")
+        else:
+            print(f"{name:36s} {result['status']} ({result['reason']})")
+
+    report = {
+        "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "corpus": os.path.abspath(args.corpus),
+        "frames": {scene: len(images) for scene, images in scenes.items()},
+        "repeat": args.repeat,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+    output = args.output or os.path.join("benchmarks", f"results_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=4)
+    print(f"\nRésultats enregistrés dans {output}.")
+
+    if previous is not None:
+        print_comparison(results, previous, args.compare)
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    # Aucune cible mesurée : le rapport ne vaut rien, l'échec doit se voir en CI
+    if not any(result["status"] == "ok" for result in results.values()):
+        print("Aucune cible n'a pu être mesurée.")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,230 @@
+import os
+import io
+import glob
+import json
+import time
+import bisect
+import itertools
+import zipfile
+import threading
+import numpy as np
+import cv2
+from PIL import ImageGrab, Image
+
+# --- Constantes ---
+FRAME_MAX_AGE = 0.05  # Durée (s) pendant laquelle une capture est partagée entre détecteurs
+ROI_MERGE_RATIO = 4  # Zones capturées ensemble tant que leur union ne dépasse pas ce multiple de leur surface cumulée
+
+REPLAY_INDEX_FILE = "index.json"
+
+def bbox_area(bbox):
+    return (bbox[2] - bbox[0]) * (bbox[3] - bbox[1])
+
+# --- Sources d'images ---
+class LiveScreenSource:
+    # Écran réel
+    def grab(self, bbox=None):
+        return ImageGrab.grab(bbox=bbox), time.time()
+
+class ReplayScreenSource:
+    # Captures enregistrées (dossier ou archive .zip), avec index.json optionnel {"frames": [{"file", "timestamp"}]}
+    def __init__(self, path, realtime=False, loop=True):
+        self.path = path
+        self.realtime = realtime
+        self.loop = loop
+        self.cursor = 0
+        self._zip = zipfile.ZipFile(path) if zipfile.is_zipfile(path) else None
+        self._images = {}
+        self.frames = self._read_index()
+        if not self.frames:
+            raise ValueError(f"Aucune capture trouvée dans {path}.")
+        self._timestamps = [timestamp for _, timestamp in self.frames]
+        self._start_time = None
+
+    def _read_index(self):
+        if self._zip is not None:
+            names = self._zip.namelist()
+            if REPLAY_INDEX_FILE in names:
+                return [(f["file"], f["timestamp"]) for f in json.loads(self._zip.read(REPLAY_INDEX_FILE))["frames"]]
+            infos = sorted((i for i in self._zip.infolist() if i.filename.lower().endswith(".png")), key=lambda i: i.filename)
+            return [(i.filename, time.mktime(i.date_time + (0, 0, -1))) for i in infos]
+
+        index_path = os.path.join(self.path, REPLAY_INDEX_FILE)
+        if os.path.exists(index_path):
+            with open(index_path, 'r') as f:
+                return [(entry["file"], entry["timestamp"]) for entry in json.load(f)["frames"]]
+        paths = sorted(glob.glob(os.path.join(self.path, "*.png")))
+        return [(os.path.basename(p), os.path.getmtime(p)) for p in paths]
+
+    def _load(self, name):
+        if name not in self._images:
+            if self._zip is not None:
+                image = Image.open(io.BytesIO(self._zip.read(name)))
+            else:
+                image = Image.open(os.path.join(self.path, name))
+            self._images[name] = image.convert("RGB")
+        return self._images[name]
+
+    def seek(self, index):
+        self.cursor = index % len(self.frames) if self.loop else min(index, len(self.frames) - 1)
+        self._start_time = None
+
+    def _current_index(self):
+        if not self.realtime:
+            index = self.cursor
+            self.cursor = (self.cursor + 1) % len(self.frames) if self.loop else min(self.cursor + 1, len(self.frames) - 1)
+            return index
+        # Temps réel : image enregistrée correspondant au temps écoulé depuis la première capture servie
+        now = time.time()
+        if self._start_time is None:
+            self._start_time = now - (self.frames[self.cursor][1] - self.frames[0][1])
+        elapsed = now - self._start_time
+        duration = self.frames[-1][1] - self.frames[0][1]
+        if self.loop and duration > 0:
+            elapsed %= duration
+        target = self.frames[0][1] + elapsed
+        self.cursor = max(0, bisect.bisect_right(self._timestamps, target) - 1)
+        return self.cursor
+
+    def grab(self, bbox=None):
+        name, timestamp = self.frames[self._current_index()]
+        image = self._load(name)
+        return (image.crop(bbox) if bbox else image), timestamp
+
+class RecordingScreenSource:
+    # Enregistre les captures plein écran d'une autre source pour constituer un corpus rejouable (à rejouer en temps réel)
+    # Les petites zones (pixels, ROI) et les captures trop rapprochées sont servies sans être enregistrées
+    def __init__(self, source, output_dir, min_interval=0.2, min_area=200 * 200):
+        self.source = source
+        self.output_dir = output_dir
+        self.min_interval = min_interval
+        self.min_area = min_area
+        self.frames = []
+        self._last_record = None
+        os.makedirs(output_dir, exist_ok=True)
+
+    def grab(self, bbox=None):
+        small = bbox is not None and bbox_area(bbox) < self.min_area
+        if small or (self._last_record is not None and time.time() - self._last_record < self.min_interval):
+            return self.source.grab(bbox)
+        image, timestamp = self.source.grab(None)
+        self._last_record = time.time()
+        name = f"{len(self.frames):06d}.png"
+        image.save(os.path.join(self.output_dir, name))
+        self.frames.append({"file": name, "timestamp": timestamp})
+        with open(os.path.join(self.output_dir, REPLAY_INDEX_FILE), 'w') as f:
+            json.dump({"frames": self.frames}, f, indent=4)
+        return (image.crop(bbox) if bbox else image), timestamp
+
+class Frame:
+    # --- Capture horodatée partagée par tous les détecteurs ---
+    def __init__(self, frame_id, timestamp, image, bbox, source_timestamp=None):
+        self.frame_id = frame_id
+        self.timestamp = timestamp
+        self.source_timestamp = timestamp if source_timestamp is None else source_timestamp
+        self.image = image
+        self.bbox = bbox
+        self._array = None
+        self._gray = None
+        self._gray_levels = {}
+
+    @property
+    def offset(self):
+        return (self.bbox[0], self.bbox[1])
+
+    @property
+    def array(self):
+        # Tableau RGB en lecture seule : les détecteurs doivent copier avant de modifier
+        if self._array is None:
+            self._array = np.array(self.image)
+            self._array.setflags(write=False)
+        return self._array
+
+    @property
+    def gray(self):
+        if self._gray is None:
+            self._gray = cv2.cvtColor(self.array, cv2.COLOR_RGB2GRAY)
+            self._gray.setflags(write=False)
+        return self._gray
+
+    def gray_level(self, level):
+        # Niveau de pyramide (1 = 1/2, 2 = 1/4...) calculé une seule fois par capture
+        if level == 0:
+            return self.gray
+        if level not in self._gray_levels:
+            self._gray_levels[level] = cv2.pyrDown(self.gray_level(level - 1))
+        return self._gray_levels[level]
+
+    def covers(self, bbox):
+        if bbox is None:
+            return self.bbox == FrameBus.full_screen_bbox
+        return (self.bbox[0] <= bbox[0] and self.bbox[1] <= bbox[1]
+                and bbox[2] <= self.bbox[2] and bbox[3] <= self.bbox[3])
+
+    def crop(self, bbox):
+        # bbox en coordonnées écran, convertie en coordonnées relatives à la capture
+        ox, oy = self.offset
+        local_box = (bbox[0] - ox, bbox[1] - oy, bbox[2] - ox, bbox[3] - oy)
+        cropped = Frame(self.frame_id, self.timestamp, self.image.crop(local_box), tuple(bbox), self.source_timestamp)
+        if self._array is not None:
+            cropped._array = self._array[local_box[1]:local_box[3], local_box[0]:local_box[2]]
+        if self._gray is not None:
+            cropped._gray = self._gray[local_box[1]:local_box[3], local_box[0]:local_box[2]]
+        return cropped
+
+class FrameBus:
+    # --- Service de capture : une seule capture d'écran par tick ---
+    full_screen_bbox = None
+
+    def __init__(self, max_age=FRAME_MAX_AGE, source=None):
+        self.max_age = max_age
+        self.source = source or LiveScreenSource()
+        self._lock = threading.Lock()
+        self._frame = None
+        self._ids = itertools.count(1)
+
+    def set_source(self, source):
+        with self._lock:
+            self.source = source
+            self._frame = None
+
+    def _capture(self, bbox):
+        image, source_timestamp = self.source.grab(bbox)
+        if bbox is None:
+            bbox = (0, 0, image.width, image.height)
+            FrameBus.full_screen_bbox = bbox
+        return Frame(next(self._ids), time.time(), image, tuple(bbox), source_timestamp)
+
+    def grab(self, bbox=None, max_age=None, cache=True):
+        if not cache:
+            # Capture privée (surveillance rapide d'une petite zone) : sans attendre le verrou ni remplacer la capture partagée
+            return self._capture(bbox)
+        max_age = self.max_age if max_age is None else max_age
+        with self._lock:
+            frame = self._frame
+            if frame is not None and time.time() - frame.timestamp <= max_age and frame.covers(bbox):
+                return frame if bbox is None or tuple(bbox) == frame.bbox else frame.crop(bbox)
+
+            new_frame = self._capture(bbox)
+            # On ne remplace une capture encore fraîche que par une capture au moins aussi large
+            if frame is None or time.time() - frame.timestamp > self.max_age or new_frame.covers(frame.bbox):
+                self._frame = new_frame
+            return new_frame
+
+    def grab_rois(self, bboxes, max_age=None):
+        # Zones proches : une seule capture de leur union, puis découpage ; zones éloignées : une petite capture par zone
+        union = (min(b[0] for b in bboxes), min(b[1] for b in bboxes),
+                 max(b[2] for b in bboxes), max(b[3] for b in bboxes))
+        if bbox_area(union) > ROI_MERGE_RATIO * sum(bbox_area(b) for b in bboxes):
+            return [self.grab(bbox=b, max_age=max_age) for b in bboxes]
+        frame = self.grab(bbox=union, max_age=max_age)
+        return [frame.crop(b) for b in bboxes]
+
+    def pixel(self, x, y, max_age=None):
+        return self.grab(bbox=(x, y, x + 1, y + 1), max_age=max_age).image.getpixel((0, 0))
+
+    def invalidate(self):
+        with self._lock:
+            self._frame = None
+
+frame_bus = FrameBus()
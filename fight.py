@@ -1,18 +1,20 @@
-import pyautogui
 import json
 import time
 import math
 import cv2
 import random
 import numpy as np
-import winsound
-import pyperclip
-import keyboard
-from PIL import ImageGrab, Image
+from PIL import Image
 import os
 import threading
+from capture import frame_bus
+from templates import template_registry
+from vision import match_template, match_template_pyramid, locate_template, match_templates_batched, count_color_hits
 from utils import log, is_fight_started, check_and_close_fight_end_popup, check_for_pause, is_stop_requested, get_map_coordinates, image_file_lock
+from utils import COORDINATES_CROP_BOX, threshold_coordinate_strip, read_coordinates_with_glyphs, parse_coordinates_text
+from ocr import ocr_service, hud_digit_glyphs, DIGIT_CHARS
 from grid import grid_instance
+from tactics import plan_turn, describe_plan
 
 # --- Configuration Globale ---
 with open("config.json", "r") as f: CONFIG = json.load(f)
@@ -33,8 +35,8 @@ MONSTER_START_CELL_COLOR_RGB = (0, 0, 255)
 ALLY_IMAGES = [os.path.join(IMAGE_FOLDER, f"ally{i}.png") for i in range(1, 5)]
 ENEMY_IMAGES = [os.path.join(IMAGE_FOLDER, f"enemy{i}.png") for i in range(1, 5)]
 SHADOW_RGB_COLOR = (56, 44, 22)
-ALLY_TEMPLATES = [cv2.imread(p, 0) for p in ALLY_IMAGES if os.path.exists(p)]
-ENEMY_TEMPLATES = [cv2.imread(p, 0) for p in ENEMY_IMAGES if os.path.exists(p)]
+ALLY_TEMPLATES = [t.gray for t in map(template_registry.get, ALLY_IMAGES) if t is not None]
+ENEMY_TEMPLATES = [t.gray for t in map(template_registry.get, ENEMY_IMAGES) if t is not None]
 MONSTER_START_COLORS_RGB = [tuple(int(h[i:i+2], 16) for i in (0, 2, 4)) for h in COMBAT_CONFIG.get("MONSTER_COLORS_HEX", [])]
 
 SPELL_COOLDOWNS = {}
@@ -43,13 +45,15 @@ CURRENT_TURN = 0
 combat_modes_checked = False
 
 def click_random_in_rect(x, y, w, h):
+    import pyautogui
     inner_w, inner_h = int(w * 0.8), int(h * 0.8)
     rand_x = random.randint(x - inner_w // 2, x + inner_w // 2)
     rand_y = random.randint(y - inner_h // 2, y + inner_h // 2)
     pyautogui.click(rand_x, rand_y)
+    frame_bus.invalidate()
 
 
-def find_on_screen(template_path, threshold=0.8, bbox=None):
+def find_on_screen(template_path, threshold=0.8, bbox=None, pyramid=False):
     template_name = os.path.basename(template_path).replace('.png', '').upper() + "_POS"
     predefined_pos = POSITIONS_CONFIG.get(template_name)
 
@@ -59,19 +63,20 @@ def find_on_screen(template_path, threshold=0.8, bbox=None):
         bbox = (x - search_area, y - search_area, x + search_area, y + search_area)
 
     try:
-        screen = ImageGrab.grab(bbox=bbox)
-        screen_gray = cv2.cvtColor(np.array(screen), cv2.COLOR_BGR2GRAY)
-        template = cv2.imread(template_path, 0)
+        template = template_registry.get(template_path)
         if template is None: return None
         
-        res = cv2.matchTemplate(screen_gray, template, cv2.TM_CCOEFF_NORMED)
-        loc = np.where(res >= threshold)
-
-        if len(loc[0]) > 0:
-            h, w = template.shape
-            offset_x = bbox[0] if bbox else 0
-            offset_y = bbox[1] if bbox else 0
-            return (loc[1][0] + w // 2 + offset_x, loc[0][0] + h // 2 + offset_y, w, h)
+        # Sans zone imposée, recherche d'abord autour de la dernière position apprise
+        if bbox is None:
+            match = locate_template(template, threshold, pyramid=pyramid)
+        elif pyramid:
+            match = match_template_pyramid(template, threshold, bbox=bbox)
+        else:
+            match = match_template(template, threshold, bbox=bbox)
+
+        if match:
+            h, w = template.h, template.w
+            return (match[0] + w // 2, match[1] + h // 2, w, h)
     except Exception as e:
         log(f"[Combat] Erreur lors de la recherche de {template_path}: {e}")
     return None
@@ -96,6 +101,7 @@ def wait_for_next_turn(timeout=30):
     return False
 
 def ensure_mode_is_on(off_image, on_image, mode_name, retries=3, delay=0.5):
+    import pyautogui
     if find_on_screen(on_image, threshold=0.9):
         log(f"[Combat Auto] {mode_name} est déjà activé.")
         return True
@@ -105,6 +111,7 @@ def ensure_mode_is_on(off_image, on_image, mode_name, retries=3, delay=0.5):
         if off_button_pos:
             log(f"[Combat Auto] {mode_name} est désactivé. Tentative d'activation ({i+1}/{retries})...")
             pyautogui.click(off_button_pos[0], off_button_pos[1])
+            frame_bus.invalidate()
             time.sleep(delay)
             if find_on_screen(on_image, threshold=0.9):
                 log(f"[Combat Auto] {mode_name} activé avec succès.")
@@ -114,16 +121,18 @@ def ensure_mode_is_on(off_image, on_image, mode_name, retries=3, delay=0.5):
     log(f"[Combat Auto] AVERTISSEMENT: Échec de l'activation de {mode_name} après {retries} tentatives. Le combat peut être instable.")
     return False
 
-def find_cells_by_color(target_color_rgb, tolerance=50, min_area=200, bbox=None):
-    screen_pil = ImageGrab.grab(bbox=bbox)
-    screen_np = np.array(screen_pil)
+def find_cells_by_color(target_color_rgb, tolerance=50, min_area=200, bbox=None, frame=None):
+    if frame is None:
+        frame = frame_bus.grab(bbox=bbox)
+    elif bbox is not None:
+        frame = frame.crop(bbox)
+    screen_np = frame.array
+    offset_x, offset_y = frame.offset
     
     lower_bound = np.array([max(0, c - tolerance) for c in target_color_rgb])
     upper_bound = np.array([min(255, c + tolerance) for c in target_color_rgb])
     
-    screen_bgr = cv2.cvtColor(screen_np, cv2.COLOR_RGB2BGR)
-    
-    mask = cv2.inRange(screen_bgr, lower_bound[::-1], upper_bound[::-1])
+    mask = cv2.inRange(screen_np, lower_bound, upper_bound)
     contours, _ = cv2.findContours(mask, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
 
     positions = []
@@ -131,99 +140,63 @@ def find_cells_by_color(target_color_rgb, tolerance=50, min_area=200, bbox=None)
         if cv2.contourArea(c) > min_area:
             M = cv2.moments(c)
             if M["m00"] > 0:
-                cx = int(M["m10"] / M["m00"]) + (bbox[0] if bbox else 0)
-                cy = int(M["m01"] / M["m00"]) + (bbox[1] if bbox else 0)
+                cx = int(M["m10"] / M["m00"]) + offset_x
+                cy = int(M["m01"] / M["m00"]) + offset_y
                 positions.append((cx, cy))
-    screen_positions = positions
-    grid_positions = [grid_instance.get_cell_from_screen_coords(pos[0], pos[1]) for pos in screen_positions]
+    grid_positions = grid_instance.get_cells_from_screen_coords(positions)
     return list(set(filter(None, grid_positions)))
 
-def is_monster_color_present_on_cell(screenshot_pil, grid_cell, colors_rgb, tolerance=20, radius=15, min_pixels=5):
-    screen_pos = grid_instance.cells.get(grid_cell)
-    if not screen_pos:
-        return False
-
-    game_area_x_offset, game_area_y_offset = 0, 24
-    x_center_rel = screen_pos[0] - game_area_x_offset
-    y_center_rel = screen_pos[1] - game_area_y_offset
-
-    pixel_count = 0
-    for x_offset in range(-radius, radius + 1):
-        for y_offset in range(-radius, radius + 1):
-            if x_offset**2 + y_offset**2 <= radius**2:
-                try:
-                    pixel = screenshot_pil.getpixel((x_center_rel + x_offset, y_center_rel + y_offset))
-                    for color_rgb in colors_rgb:
-                        if all(abs(pixel[i] - color_rgb[i]) <= tolerance for i in range(3)):
-                            pixel_count += 1
-                            if pixel_count >= min_pixels:
-                                return True
-                            break
-                except IndexError:
-                    continue
-    return False
+def _cell_centers_in_frame(frame, grid_cells):
+    offset_x, offset_y = frame.offset
+    known = [(i, grid_instance.cells[c]) for i, c in enumerate(grid_cells) if c in grid_instance.cells]
+    indices = np.array([i for i, _ in known], dtype=np.int64)
+    centers = np.array([(p[0] - offset_x, p[1] - offset_y) for _, p in known], dtype=np.int64).reshape(-1, 2)
+    return indices, centers
+
+def count_monster_color_hits_on_cells(frame, grid_cells, colors_rgb, tolerance=20, radius=15):
+    counts = np.zeros(len(grid_cells), dtype=np.int64)
+    indices, centers = _cell_centers_in_frame(frame, grid_cells)
+    counts[indices] = count_color_hits(frame.array, centers, colors_rgb, tolerance, radius)
+    return counts
 
-def is_shadow_present_on_cell(screenshot_pil, grid_cell, color_rgb, tolerance=20, radius=10, min_pixels=5):
-    screen_pos = grid_instance.cells.get(grid_cell)
-    if not screen_pos:
-        return False
-
-    game_area_x_offset, game_area_y_offset = 0, 24
-    x_center_rel = screen_pos[0] - game_area_x_offset
-    y_center_rel = screen_pos[1] - game_area_y_offset
-
-    pixel_count = 0
-    for x_offset in range(-radius, radius + 1):
-        for y_offset in range(-radius, radius + 1):
-            if x_offset**2 + y_offset**2 <= radius**2:
-                try:
-                    pixel = screenshot_pil.getpixel((x_center_rel + x_offset, y_center_rel + y_offset))
-                    if all(abs(pixel[i] - color_rgb[i]) <= tolerance for i in range(3)):
-                        pixel_count += 1
-                except IndexError:
-                    continue
-    return pixel_count >= min_pixels
-
-def find_entities_by_image(templates, screenshot_pil, combat_overrides, threshold=0.8, y_compensation_factor=1.5, exclude_rect=None):
+def count_shadow_hits_on_cells(frame, grid_cells, color_rgb, tolerance=20, radius=10):
+    counts = np.zeros(len(grid_cells), dtype=np.int64)
+    indices, centers = _cell_centers_in_frame(frame, grid_cells)
+    counts[indices] = count_color_hits(frame.array, centers, [color_rgb], tolerance, radius)
+    return counts
+
+def is_monster_color_present_on_cell(frame, grid_cell, colors_rgb, tolerance=20, radius=15, min_pixels=5):
+    return count_monster_color_hits_on_cells(frame, [grid_cell], colors_rgb, tolerance, radius)[0] >= min_pixels
+
+def is_shadow_present_on_cell(frame, grid_cell, color_rgb, tolerance=20, radius=10, min_pixels=5):
+    return count_shadow_hits_on_cells(frame, [grid_cell], color_rgb, tolerance, radius)[0] >= min_pixels
+
+def find_entities_by_image(templates, frame, combat_overrides, threshold=0.8, y_compensation_factor=1.5, exclude_rect=None):
     if not templates:
         return []
 
-    screenshot_np = np.array(screenshot_pil)
+    screenshot_gray = frame.gray
     if exclude_rect:
         x1, y1, x2, y2 = exclude_rect
-        screenshot_np[y1:y2, x1:x2] = 0
-    screenshot_gray = cv2.cvtColor(screenshot_np, cv2.COLOR_BGR2GRAY)
-    found_centers = []
-    scores = {}
-    for template in templates:
-        if template is None: continue
-        h, w = template.shape
-        res = cv2.matchTemplate(screenshot_gray, template, cv2.TM_CCOEFF_NORMED)
-        loc = np.where(res >= threshold)
-
-        for pt in zip(*loc[::-1]):
-            center_x, center_y = pt[0] + w // 2, pt[1] + h // 2
-            is_duplicate = any(abs(center_x - fx) < 30 and abs(center_y - fy) < 30 for fx, fy in found_centers)
-            if not is_duplicate:
-                found_centers.append((center_x, center_y))
-                scores[(center_x, center_y)] = res[pt[1], pt[0]]
-
-    grid_positions = set()
-    for center_x, center_y in found_centers:
-        anchor_x, anchor_y = center_x, center_y + int(30 * (y_compensation_factor - 1.0))
-        grid_cell = grid_instance.get_cell_from_screen_coords(anchor_x, anchor_y)
-        if grid_cell and combat_overrides.get(str(grid_cell)) != "obstacle":
-            if is_shadow_present_on_cell(screenshot_pil, grid_cell, SHADOW_RGB_COLOR):
-                grid_positions.add((grid_cell, scores.get((center_x, center_y), 0)))
+        screenshot_gray = screenshot_gray.copy()
+        screenshot_gray[y1:y2, x1:x2] = 0
+    found_centers, scores = match_templates_batched(screenshot_gray, templates, threshold)
 
+    anchors = found_centers + np.array([0, int(30 * (y_compensation_factor - 1.0))])
+    grid_cells = grid_instance.get_cells_from_screen_coords(anchors)
+    candidates = [(grid_cell, score) for grid_cell, score in zip(grid_cells, scores.tolist())
+                  if grid_cell and combat_overrides.get(grid_cell) != "obstacle"]
+
+    shadow_counts = count_shadow_hits_on_cells(frame, [cell for cell, _ in candidates], SHADOW_RGB_COLOR)
+    grid_positions = {candidate for candidate, count in zip(candidates, shadow_counts) if count >= 5}
     return list(grid_positions)
 
-def get_start_cells_from_grid(screenshot):
+def get_start_cells_from_grid(frame):
     global possible_player_starts, possible_monster_starts
     game_area = (0, 24, 1348, 808)
     
-    possible_player_starts = find_cells_by_color(PLAYER_START_CELL_COLOR_RGB, tolerance=50, min_area=200, bbox=game_area)
-    possible_monster_starts = find_cells_by_color(MONSTER_START_CELL_COLOR_RGB, tolerance=50, min_area=200, bbox=game_area)
+    possible_player_starts = find_cells_by_color(PLAYER_START_CELL_COLOR_RGB, tolerance=50, min_area=200, bbox=game_area, frame=frame)
+    possible_monster_starts = find_cells_by_color(MONSTER_START_CELL_COLOR_RGB, tolerance=50, min_area=200, bbox=game_area, frame=frame)
     
     combat_state.possible_player_starts = possible_player_starts
     combat_state.possible_monster_starts = possible_monster_starts
@@ -242,7 +215,7 @@ def is_placement_cell_occupied(cell_coord, cell_color_rgb):
         screen_pos = grid_instance.cells.get(cell_coord)
         if not screen_pos: return True
 
-        pixel_at_center = pyautogui.pixel(screen_pos[0], screen_pos[1] - 10)
+        pixel_at_center = frame_bus.pixel(screen_pos[0], screen_pos[1] - 10)
         is_occupied = all(abs(pixel_at_center[i] - cell_color_rgb[i]) > 50 for i in range(3))
         return is_occupied
     except Exception as e:
@@ -250,20 +223,21 @@ def is_placement_cell_occupied(cell_coord, cell_color_rgb):
         return True
  
 def verify_and_update_position(old_pos, destination_cell, game_area, gui_app, combat_overrides):
+    import pyautogui
     log("[Combat Auto] Vérification de la position après mouvement...")
     pyautogui.moveTo(100, 100, duration=0.1)
     
     for attempt in range(3):
         time.sleep(0.7)
-        screenshot_after_move = ImageGrab.grab(bbox=game_area)
+        frame_after_move = frame_bus.grab(bbox=game_area)
 
-        if is_shadow_present_on_cell(screenshot_after_move, destination_cell, SHADOW_RGB_COLOR):
+        if is_shadow_present_on_cell(frame_after_move, destination_cell, SHADOW_RGB_COLOR):
             log(f"[Combat Auto] Déplacement réussi vers {destination_cell}.")
             combat_state.player_positions = [destination_cell]
             if gui_app: gui_app.after(0, gui_app.draw_map, True)
             return destination_cell, True
 
-        new_pos_list = [p for p, s in find_entities_by_image(ALLY_TEMPLATES, screenshot_after_move, combat_overrides, y_compensation_factor=1.8)]
+        new_pos_list = [p for p, s in find_entities_by_image(ALLY_TEMPLATES, frame_after_move, combat_overrides, y_compensation_factor=1.8)]
         if new_pos_list and new_pos_list[0] != old_pos:
             log(f"[Combat Auto] Déplacement réussi vers {new_pos_list[0]} (détection globale).")
             combat_state.player_positions = [new_pos_list[0]]
@@ -275,10 +249,11 @@ def verify_and_update_position(old_pos, destination_cell, game_area, gui_app, co
     return old_pos, False
 
 def update_targets_after_action(game_area, combat_overrides, gui_app):
+    import pyautogui
     log("[Combat Auto] Ré-évaluation des cibles...")
     pyautogui.moveTo(100, 100, duration=0.1)
-    screenshot = ImageGrab.grab(bbox=game_area)    
-    monster_positions_with_scores = find_entities_by_image(ENEMY_TEMPLATES, screenshot, combat_overrides, y_compensation_factor=1.5, exclude_rect=(1190, 671, 1275, 701))
+    frame = frame_bus.grab(bbox=game_area, max_age=0)
+    monster_positions_with_scores = find_entities_by_image(ENEMY_TEMPLATES, frame, combat_overrides, y_compensation_factor=1.5, exclude_rect=(1190, 671, 1275, 701))
     combat_state.monster_positions = [p for p, s in monster_positions_with_scores]
     log(f"[Combat Auto] {len(combat_state.monster_positions)} cibles restantes.")
     if gui_app: gui_app.after(0, gui_app.draw_map, True)
@@ -303,8 +278,56 @@ class CombatState:
 
 combat_state = CombatState()
 
+class ApMpTracker:
+    # --- PA/PM du tour : décompte des coûts connus, relecture à l'écran seulement quand le décompte n'est plus sûr ---
+    def __init__(self):
+        self.pa = None
+        self.pm = None
+        self.is_stale = True
+        self.turn_start_values = (ACTION_POINTS, MOVEMENT_POINTS)  # Valeurs attendues au début du prochain tour
+
+    def start_turn(self):
+        self.pa, self.pm = self.turn_start_values
+        self.is_stale = True
+
+    def expected(self):
+        return (self.pa, self.pm)
+
+    def update(self, pa, pm, turn_start=False):
+        self.pa, self.pm = pa, pm
+        self.is_stale = False
+        if turn_start:
+            self.turn_start_values = (pa, pm)
+
+    def spend(self, pa=0, pm=0):
+        self.pa = max(0, self.pa - pa)
+        self.pm = max(0, self.pm - pm)
+        return self.pa, self.pm
+
+    def invalidate(self):
+        self.is_stale = True
+
+ap_mp_tracker = ApMpTracker()
+
+def threshold_ap_mp_zone(zone_frame):
+    return cv2.threshold(zone_frame.gray, 200, 255, cv2.THRESH_BINARY)[1]
+
+def read_ap_mp_digits(zone_frames, expected):
+    # Lecture par modèles de chiffres ; tant que tous les chiffres ne sont pas appris, seule une valeur attendue est acceptée
+    values = []
+    for zone_frame, expected_value in zip(zone_frames, expected):
+        text = hud_digit_glyphs.classify(threshold_ap_mp_zone(zone_frame))
+        if not text.isdigit():
+            return None
+        value = int(text)
+        if value != expected_value and not hud_digit_glyphs.knows(DIGIT_CHARS):
+            return None
+        values.append(value)
+    return values
+
 # --- Gestion du combat ---
 def handle_fight_auto(gui_app=None):
+    import pyautogui, keyboard, winsound
     global combat_modes_checked, CURRENT_TURN, SPELL_COOLDOWNS
 
     combat_state.reset()
@@ -337,20 +360,16 @@ def handle_fight_auto(gui_app=None):
             ensure_mode_is_on("Images/lock_mode_off.png", "Images/lock_mode_on.png", "Verrouillage du combat")
 
         game_area = (0, 24, 1348, 808) 
-        screenshot = ImageGrab.grab(bbox=game_area)
-        player_starts, monster_starts = get_start_cells_from_grid(screenshot)
+        frame = frame_bus.grab(bbox=game_area)
+        screenshot = frame.image
+        player_starts, monster_starts = get_start_cells_from_grid(frame)
         log(f"[Combat Auto] {len(player_starts)} cases de départ alliées trouvées : {player_starts}")
         log(f"[Combat Auto] {len(monster_starts)} cases de départ ennemies trouvées : {monster_starts}")
 
-        detected_monsters = []
-        for cell in monster_starts:
-            screen_pos = grid_instance.cells.get(cell)
-            if screen_pos:
-                has_shadow = is_shadow_present_on_cell(screenshot, cell, SHADOW_RGB_COLOR)
-                has_monster_color = is_monster_color_present_on_cell(screenshot, cell, MONSTER_START_COLORS_RGB)
-
-                if has_shadow or has_monster_color:
-                    detected_monsters.append(cell)
+        shadow_counts = count_shadow_hits_on_cells(frame, monster_starts, SHADOW_RGB_COLOR)
+        monster_color_counts = count_monster_color_hits_on_cells(frame, monster_starts, MONSTER_START_COLORS_RGB)
+        detected_monsters = [cell for cell, shadow, color in zip(monster_starts, shadow_counts, monster_color_counts)
+                             if cell in grid_instance.cells and (shadow >= 5 or color >= 5)]
         combat_state.monster_positions = detected_monsters
         log(f"[Combat Auto] {len(combat_state.monster_positions)} monstres détectés sur les cases de départ : {combat_state.monster_positions}")
 
@@ -367,7 +386,7 @@ def handle_fight_auto(gui_app=None):
                 screenshot.save(tactic_path)
 
         if player_starts:
-            current_player_pos_list = [p for p,s in find_entities_by_image(ALLY_TEMPLATES, screenshot, {}, y_compensation_factor=1.8)]
+            current_player_pos_list = [p for p,s in find_entities_by_image(ALLY_TEMPLATES, frame, {}, y_compensation_factor=1.8)]
             current_player_pos = current_player_pos_list[0] if current_player_pos_list else None
 
             best_cell = None
@@ -392,6 +411,7 @@ def handle_fight_auto(gui_app=None):
                 screen_pos = grid_instance.cells[best_start_cell]
                 log(f"[Combat Auto] Meilleure case de départ : {best_start_cell}. Clic sur {screen_pos}.")
                 pyautogui.click(screen_pos)
+                frame_bus.invalidate()
                 time.sleep(0.5)
 
         ready_button_info = find_on_screen("Images/button_ready.png")
@@ -403,6 +423,7 @@ def handle_fight_auto(gui_app=None):
             log("[Combat Auto] Bouton 'Prêt' non trouvé, appui sur F1 en fallback.")
             time.sleep(2)
             pyautogui.press('f1')
+            frame_bus.invalidate()
 
     log("[Combat Auto] Attente du début du combat...")
     if gui_app: 
@@ -412,36 +433,53 @@ def handle_fight_auto(gui_app=None):
     time.sleep(3)
     if gui_app: gui_app.after(0, gui_app.draw_map, True)
 
-    def read_ap_mp():
-        import pytesseract
+    def read_hud(expected, include_coords=True):
+        # PA, PM et bande des coordonnées : petites captures séparées (zones éloignées), chiffres lus par modèles, OCR groupé si nécessaire
         pa_pos = POSITIONS_CONFIG.get("PA_OCR_POS")
         pm_pos = POSITIONS_CONFIG.get("PM_OCR_POS")
         
         if not pa_pos or not pm_pos:
-            return ACTION_POINTS, MOVEMENT_POINTS
+            return ACTION_POINTS, MOVEMENT_POINTS, None
 
         for attempt in range(3):
             try:
-                screenshot = ImageGrab.grab()
-                
-                def ocr_zone(pos):
-                    zone = (pos[0] - 10, pos[1] - 10, pos[0] + 10, pos[1] + 10) # Zone réduite à 20x20
-                    img = screenshot.crop(zone)
-                    img_gray = cv2.cvtColor(np.array(img), cv2.COLOR_RGB2GRAY)
-                    img_thresh = cv2.threshold(img_gray, 200, 255, cv2.THRESH_BINARY_INV)[1]
-                    text = pytesseract.image_to_string(img_thresh, config='--psm 7 -c tessedit_char_whitelist=0123456789')
-                    return int(text.strip())
-
-                pa = ocr_zone(pa_pos)
-                pm = ocr_zone(pm_pos)
-                log(f"[OCR] PA lus: {pa}, PM lus: {pm}")
-                return pa, pm
-            except (ValueError, TypeError, pytesseract.TesseractError) as e:
+                zones = [(pos[0] - 10, pos[1] - 10, pos[0] + 10, pos[1] + 10) for pos in (pa_pos, pm_pos)] # Zones réduites à 20x20
+                if include_coords:
+                    zones.append(COORDINATES_CROP_BOX)
+                zone_frames = frame_bus.grab_rois(zones, max_age=0)
+                ap_mp_frames = zone_frames[:2]
+
+                # Les coordonnées ne passent par l'OCR que si les glyphes ne suffisent pas
+                coords, strip = None, None
+                if include_coords:
+                    strip = threshold_coordinate_strip(zone_frames[2])
+                    coords = read_coordinates_with_glyphs(strip)
+
+                values = read_ap_mp_digits(ap_mp_frames, expected)
+                requests = [] if values else [(255 - threshold_ap_mp_zone(zone_frame), DIGIT_CHARS) for zone_frame in ap_mp_frames]
+                if include_coords and coords is None:
+                    requests.append((255 - strip, None))
+                texts = ocr_service.read_batch(requests)
+                if include_coords and coords is None:
+                    coords = parse_coordinates_text(strip, texts[-1])
+
+                if values:
+                    pa, pm = values
+                else:
+                    pa = int(texts[0].strip())
+                    pm = int(texts[1].strip())
+                    # Une lecture OCR qui confirme la valeur attendue sert d'exemple pour les modèles de chiffres
+                    for zone_frame, value, expected_value in zip(ap_mp_frames, (pa, pm), expected):
+                        if value == expected_value:
+                            hud_digit_glyphs.learn(threshold_ap_mp_zone(zone_frame), str(value))
+                log(f"[OCR] PA lus: {pa}, PM lus: {pm}{'' if values else ' (OCR)'}")
+                return pa, pm, coords or None
+            except (ValueError, TypeError, IndexError) as e:
                 log(f"[OCR] Erreur de lecture PA/PM (essai {attempt+1}/3): {e}. Nouvel essai...")
                 time.sleep(0.2)
         
         log("[OCR] Échec de la lecture des PA/PM après plusieurs tentatives. Utilisation des valeurs par défaut.")
-        return ACTION_POINTS, MOVEMENT_POINTS
+        return ACTION_POINTS, MOVEMENT_POINTS, None
 
     game_area = (0, 24, 1348, 808)
 
@@ -461,7 +499,9 @@ def handle_fight_auto(gui_app=None):
 
         CURRENT_TURN += 1
         log("[Combat Auto] C'est notre tour !")
-        current_pa, current_pm = read_ap_mp()
+        ap_mp_tracker.start_turn()
+        current_pa, current_pm, hud_map_coords = read_hud(ap_mp_tracker.expected())
+        ap_mp_tracker.update(current_pa, current_pm, turn_start=True)
         combat_state.current_pa = current_pa
         combat_state.current_pm = current_pm
         log(f"[Combat Auto] Début du tour {CURRENT_TURN} avec {current_pa} PA et {current_pm} PM.")
@@ -472,6 +512,7 @@ def handle_fight_auto(gui_app=None):
             if not ensure_mode_is_on("Images/creature_mode_off.png", "Images/creature_mode_on.png", "Mode Créature"): # Appel unique
                 log("[Combat Auto] Le mode créature n'a pas pu être activé. Passage du tour.")
                 pyautogui.press('f1')
+                frame_bus.invalidate()
                 time.sleep(2)
                 continue
             combat_modes_checked = True
@@ -479,19 +520,19 @@ def handle_fight_auto(gui_app=None):
 
         log("[Combat Auto] Analyse du terrain pour ce tour...")
         time.sleep(0.5)
-        screenshot_pil = ImageGrab.grab(bbox=game_area)
-        current_map_coords = get_map_coordinates()
-        grid_instance.map_obstacles(screenshot=screenshot_pil, map_coords=current_map_coords)
+        frame = frame_bus.grab(bbox=game_area, max_age=0)
+        current_map_coords = get_map_coordinates(first_read=hud_map_coords)
+        grid_instance.map_obstacles(frame=frame, map_coords=current_map_coords)
         time.sleep(0.5)
         
-        player_positions_with_scores = find_entities_by_image(ALLY_TEMPLATES, screenshot_pil, grid_instance.combat_overrides, y_compensation_factor=1.8)
+        player_positions_with_scores = find_entities_by_image(ALLY_TEMPLATES, frame, grid_instance.combat_overrides, y_compensation_factor=1.8)
         combat_state.player_positions = [pos for pos, score in player_positions_with_scores]
         
         if not combat_state.player_positions and CURRENT_TURN == 1 and combat_state.initial_placement_pos:
             log(f"[Combat Auto] Détection du joueur échouée, utilisation de la position de départ mémorisée : {combat_state.initial_placement_pos}")
             combat_state.player_positions = [combat_state.initial_placement_pos]
 
-        monster_positions_with_scores = find_entities_by_image(ENEMY_TEMPLATES, screenshot_pil, grid_instance.combat_overrides, y_compensation_factor=1.5, exclude_rect=(1190, 671, 1275, 701))
+        monster_positions_with_scores = find_entities_by_image(ENEMY_TEMPLATES, frame, grid_instance.combat_overrides, y_compensation_factor=1.5, exclude_rect=(1190, 671, 1275, 701))
         combat_state.monster_positions = [pos for pos, score in monster_positions_with_scores]
 
         
@@ -499,6 +540,7 @@ def handle_fight_auto(gui_app=None):
             log("[Combat Auto] Impossible de localiser le joueur. Fin du tour forcée.")
             time.sleep(2)
             pyautogui.press('f1')
+            frame_bus.invalidate()
             continue
 
         player_pos = combat_state.player_positions[0]
@@ -535,153 +577,151 @@ def handle_fight_auto(gui_app=None):
                 log("[Combat Auto] Reprise après pause. Ré-évaluation de la situation.")
                 break
 
+            if ap_mp_tracker.is_stale:
+                current_pa, current_pm, _ = read_hud(ap_mp_tracker.expected(), include_coords=False)
+                ap_mp_tracker.update(current_pa, current_pm)
+                if current_pa <= 0:
+                    break
+
             target = get_closest_entity(player_pos, combat_state.monster_positions)
             if not target:
                 log("[Combat Auto] Plus de cibles après ré-analyse. Fin du tour.")
                 break
 
             action_taken = False
-            best_attack_spell = None
-
-            # --- 1. Tenter d'attaquer depuis la position actuelle ---
-            if current_pa > 0:
-                for spell in SPELLS:
-                    if spell.get('is_movement'): continue
-
-                    casts_this_turn = spell_casts.get(spell['name'], 0)
-                    max_casts = spell.get('casts_per_turn', 99)
-                    if current_pa >= spell['cost'] and casts_this_turn < max_casts:
-                        dist = grid_instance.get_distance(player_pos, target)
-                        in_range = spell.get('range_min', 1) <= dist <= spell.get('range_max', 0)
-                        has_los = (not spell.get('requires_los', True)) or grid_instance.has_line_of_sight(player_pos, target)
-
-                        if in_range and has_los:
-                            best_attack_spell = spell
+
+            # --- 1. Plan complet du tour, exécuté d'un bloc : une seule ré-analyse des cibles à la fin ---
+            turn_plan, planned_damage = plan_turn(player_pos, combat_state.monster_positions, SPELLS, current_pa, current_pm,
+                                                  spell_casts, SPELL_COOLDOWNS, CURRENT_TURN)
+            if turn_plan:
+                log(f"[Combat Auto] Plan du tour ({planned_damage} dégâts estimés) : {describe_plan(turn_plan)}.")
+                for action in turn_plan:
+                    if action['type'] == "cast":
+                        spell, target = action['spell'], action['target']
+                        log(f"[Combat Auto] Lancement de '{spell['name']}' sur {target}.")
+                        keyboard.press_and_release(spell['key'])
+                        frame_bus.invalidate()
+                        time.sleep(random.uniform(0.2, 0.5))
+                        pyautogui.click(grid_instance.cells[target])
+                        frame_bus.invalidate()
+                        time.sleep(random.uniform(1.2, 1.5))
+                        current_pa, current_pm = ap_mp_tracker.spend(pa=spell['cost'])
+                        action_taken = True
+                        log(f"[Combat Auto] PA restants: {current_pa}, PM restants: {current_pm}")
+                        spell_casts[spell['name']] = spell_casts.get(spell['name'], 0) + 1
+                        if spell.get('cooldown'):
+                            SPELL_COOLDOWNS[spell['name']] = CURRENT_TURN
+                        time.sleep(1.0)
+                        pyautogui.moveTo(100, 100, duration=0.1)
+                        if check_and_close_fight_end_popup():
+                            fight_over = True
                             break
+
+                    elif action['type'] == "move":
+                        move_target_cell = action['cell']
+                        log(f"[Combat Auto] Déplacement de {player_pos} vers {move_target_cell} pour se mettre à portée.")
+                        pyautogui.click(grid_instance.cells[move_target_cell])
+                        frame_bus.invalidate()
+                        time.sleep(0.5)
+                        
+                        new_pos, move_success = verify_and_update_position(player_pos, move_target_cell, game_area, gui_app, grid_instance.combat_overrides)
+                        if not move_success:
+                            current_pm = 0
+                            ap_mp_tracker.pm = 0
+                            break
+                        if new_pos == move_target_cell:
+                            pm_used = action['move_cost']
                         else:
-                            log(f"[Debug] Sort '{spell['name']}': Portée? {'Oui' if in_range else 'Non'} (dist: {dist}, portée: {spell.get('range_min', 1)}-{spell.get('range_max', 0)}). LdV? {'Oui' if has_los else 'Non'}. Lancers: {casts_this_turn}/{max_casts}.")
-                
-            if best_attack_spell:
-                log(f"[Combat Auto] Lancement de '{best_attack_spell['name']}' sur {target}.")
-                keyboard.press_and_release(best_attack_spell['key'])
-                time.sleep(random.uniform(0.2, 0.5))
-                pyautogui.click(grid_instance.cells[target])
-                time.sleep(random.uniform(1.2, 1.5))
-                current_pa -= best_attack_spell['cost']
-                action_taken = True
-                log(f"[Combat Auto] PA restants: {current_pa}, PM restants: {current_pm}")
-                spell_casts[best_attack_spell['name']] = spell_casts.get(best_attack_spell['name'], 0) + 1
-                time.sleep(1.0)
-                pyautogui.moveTo(100, 100, duration=0.1)
-                if check_and_close_fight_end_popup():
-                    fight_over = True
-                    combat_is_finished = True; break
-                update_targets_after_action(game_area, grid_instance.combat_overrides, gui_app)
+                            pm_used = grid_instance.get_path_distance(player_pos, new_pos)
+                        current_pa, current_pm = ap_mp_tracker.spend(pm=pm_used)
+                        player_pos = new_pos
+                        action_taken = True
+                        if new_pos != move_target_cell:
+                            # Arrêt avant la case visée : coût réel incertain et suite du plan caduque
+                            ap_mp_tracker.invalidate()
+                            break
 
-            if fight_over or check_and_close_fight_end_popup():
-                fight_over = True
-                combat_is_finished = True
-                break
+                    elif action['type'] == "teleport":
+                        spell, teleport_cell = action['spell'], action['cell']
+                        log(f"[Combat Auto] Lancement de '{spell['name']}' vers la case {teleport_cell}.")
+                        keyboard.press_and_release(spell['key'])
+                        frame_bus.invalidate()
+                        time.sleep(random.uniform(0.2, 0.5))
+                        pyautogui.click(grid_instance.cells[teleport_cell])
+                        frame_bus.invalidate()
+                        time.sleep(1.5) # Pause pour l'animation de téléportation
+                        time.sleep(random.uniform(1.2, 1.5))
+                        current_pa, current_pm = ap_mp_tracker.spend(pa=spell['cost'])
+                        action_taken = True
+                        log(f"[Combat Auto] PA restants: {current_pa}, PM restants: {current_pm}")
+                        spell_casts[spell['name']] = spell_casts.get(spell['name'], 0) + 1
+                        SPELL_COOLDOWNS[spell['name']] = CURRENT_TURN
+                        new_pos, move_success = verify_and_update_position(player_pos, teleport_cell, game_area, gui_app, grid_instance.combat_overrides)
+                        player_pos = new_pos
+                        if new_pos != teleport_cell:
+                            break
 
-            if action_taken: continue
+                if fight_over or check_and_close_fight_end_popup():
+                    fight_over = True
+                    combat_is_finished = True
+                    break
+                update_targets_after_action(game_area, grid_instance.combat_overrides, gui_app)
+                continue
 
-            # --- 2. Tenter de se rapprocher si aucune attaque n'était possible ---
-            if not best_attack_spell and (current_pm > 0 or any(s.get('is_movement') for s in SPELLS)):
+            # --- 2. Aucune attaque possible ce tour : sort de mouvement pour se rapprocher ---
+            if any(s.get('is_movement') for s in SPELLS):
                 min_attack_cost = min((s.get('cost', 99) for s in SPELLS if not s.get('is_movement')), default=99)
                 if current_pa < min_attack_cost:
                     log("[Combat Auto] Pas assez de PA pour attaquer après un déplacement. Fin du tour.")
                     break
 
-                log("[Combat Auto] Aucune attaque possible. Tentative de rapprochement...")
-
-                # --- Logique de déplacement PM (prioritaire) ---
-                if current_pm > 0:
-                    log(f"[Debug Path] Position joueur: {player_pos} (marchable? {player_pos in grid_instance.walkable_cells})")
-                    player_neighbors = grid_instance.get_neighbors(player_pos)
-                    log(f"[Debug Path] Voisins marchables du joueur ({len(player_neighbors)}): {player_neighbors}")
-                    log(f"[Debug Path] Position cible: {target} (marchable? {target in grid_instance.walkable_cells})")
-                    log(f"[Debug Path] Cible transparente pour LdV? {target in grid_instance.los_transparent_cells}")
-                    
-                    path = grid_instance.find_path(player_pos, target)
-
-                    log(f"[Debug Path] Chemin trouvé : {path}")
-                    if path and len(path) > 1:
-                        move_target_cell = grid_instance.get_farthest_walkable_cell(path, current_pm)
-                        
-                        dist_after_move = grid_instance.get_distance(move_target_cell, target)
-                        can_attack_after_pm_move = any(
-                            spell['range_min'] <= dist_after_move <= spell['range_max'] and not spell.get('is_movement')
-                            for spell in SPELLS
-                        )
-
-                        if can_attack_after_pm_move:
-                            log(f"[Combat Auto] Déplacement de {player_pos} vers {move_target_cell} pour se mettre à portée.")
-
-                            if move_target_cell in grid_instance.cells:
-                                pyautogui.click(grid_instance.cells[move_target_cell])
-                                time.sleep(0.5)
-                                
-                                new_pos, move_success = verify_and_update_position(player_pos, move_target_cell, game_area, gui_app, grid_instance.combat_overrides)
-                                
-                                if move_success:
-                                    pm_used = grid_instance.get_path_distance(player_pos, new_pos)
-                                    current_pm -= pm_used
-                                    player_pos = new_pos
-                                    action_taken = True
-                                    if gui_app:
-                                        gui_app.after(0, gui_app.draw_map, True)
-                                    continue
-                                else:
-                                    current_pm = 0
-                            else:
-                                log(f"[Combat Auto] Erreur: La case de destination {move_target_cell} est invalide.")
-                        else:
-                            log("[Combat Auto] Déplacement PM insuffisant pour attaquer. Évaluation du sort de mouvement.")
+                log("[Combat Auto] Aucune attaque possible ce tour. Évaluation du sort de mouvement.")
                 
-                if not action_taken:
-                    # --- Logique de sort de Mouvement ---
-                    movement_spell = next((s for s in SPELLS if s.get('is_movement')), None)
-                    can_use_movement_spell = False
-                    if movement_spell:
-                        spell_name = movement_spell['name']
-                        cooldown = movement_spell.get('cooldown', 0)
-                        last_used = SPELL_COOLDOWNS.get(spell_name, -999)
-                        
-                        if current_pa >= movement_spell['cost'] and \
-                           spell_casts.get(spell_name, 0) < movement_spell.get('casts_per_turn', 99) and \
-                           CURRENT_TURN >= last_used + cooldown:
-                            can_use_movement_spell = True
-
-                    if can_use_movement_spell:
-                        movement_spell_cost = movement_spell['cost']
-                        if current_pa < movement_spell_cost:
-                            log(f"[Combat Auto] Pas assez de PA pour utiliser un sort de mouvement (coût: {movement_spell_cost}).")
-                            break
-
-                        log(f"[Combat Auto] Évaluation de l'utilisation de '{movement_spell['name']}' pour se rapprocher.")
-                        path_to_target = grid_instance.find_path(player_pos, target)
-                        if path_to_target:
-                            teleport_cell = grid_instance.get_farthest_walkable_cell(path_to_target, movement_spell['range_max'])
-                            if teleport_cell and grid_instance.get_distance(player_pos, teleport_cell) > current_pm:
-                                log(f"[Combat Auto] Lancement de '{movement_spell['name']}' vers la case {teleport_cell}.")
-                                keyboard.press_and_release(movement_spell['key'])
-                                time.sleep(random.uniform(0.2, 0.5))
-                                pyautogui.click(grid_instance.cells[teleport_cell])
-                                time.sleep(1.5) # Pause pour l'animation de téléportation
-                                time.sleep(random.uniform(1.2, 1.5))
-                                current_pa -= movement_spell['cost']
+                # --- Logique de sort de Mouvement ---
+                movement_spell = next((s for s in SPELLS if s.get('is_movement')), None)
+                can_use_movement_spell = False
+                if movement_spell:
+                    spell_name = movement_spell['name']
+                    cooldown = movement_spell.get('cooldown', 0)
+                    last_used = SPELL_COOLDOWNS.get(spell_name, -999)
+                    
+                    if current_pa >= movement_spell['cost'] and \
+                       spell_casts.get(spell_name, 0) < movement_spell.get('casts_per_turn', 99) and \
+                       CURRENT_TURN >= last_used + cooldown:
+                        can_use_movement_spell = True
+
+                if can_use_movement_spell:
+                    movement_spell_cost = movement_spell['cost']
+                    if current_pa < movement_spell_cost:
+                        log(f"[Combat Auto] Pas assez de PA pour utiliser un sort de mouvement (coût: {movement_spell_cost}).")
+                        break
+
+                    log(f"[Combat Auto] Évaluation de l'utilisation de '{movement_spell['name']}' pour se rapprocher.")
+                    reachability = grid_instance.reachability(player_pos)
+                    if reachability:
+                        teleport_cell = reachability.farthest_toward(target, movement_spell['range_max'])
+                        if teleport_cell and grid_instance.get_distance(player_pos, teleport_cell) > current_pm:
+                            log(f"[Combat Auto] Lancement de '{movement_spell['name']}' vers la case {teleport_cell}.")
+                            keyboard.press_and_release(movement_spell['key'])
+                            frame_bus.invalidate()
+                            time.sleep(random.uniform(0.2, 0.5))
+                            pyautogui.click(grid_instance.cells[teleport_cell])
+                            frame_bus.invalidate()
+                            time.sleep(1.5) # Pause pour l'animation de téléportation
+                            time.sleep(random.uniform(1.2, 1.5))
+                            current_pa, current_pm = ap_mp_tracker.spend(pa=movement_spell['cost'])
+                            action_taken = True
+                            log(f"[Combat Auto] PA restants: {current_pa}, PM restants: {current_pm}")
+                            spell_casts[movement_spell['name']] = spell_casts.get(movement_spell['name'], 0) + 1
+                            SPELL_COOLDOWNS[movement_spell['name']] = CURRENT_TURN                                
+                            new_pos, move_success = verify_and_update_position(player_pos, teleport_cell, game_area, gui_app, grid_instance.combat_overrides)
+                            if move_success:
+                                player_pos = new_pos
+                                if gui_app:
+                                    gui_app.after(0, gui_app.draw_map, True)
                                 action_taken = True
-                                log(f"[Combat Auto] PA restants: {current_pa}, PM restants: {current_pm}")
-                                spell_casts[movement_spell['name']] = spell_casts.get(movement_spell['name'], 0) + 1
-                                SPELL_COOLDOWNS[movement_spell['name']] = CURRENT_TURN                                
-                                new_pos, move_success = verify_and_update_position(player_pos, teleport_cell, game_area, gui_app, grid_instance.combat_overrides)
-                                if move_success:
-                                    player_pos = new_pos
-                                    if gui_app:
-                                        gui_app.after(0, gui_app.draw_map, True)
-                                    action_taken = True
-                                    continue
-                
+                                continue
+            
                 # --- Fin de la logique de Téléportation ---
 
             if not action_taken:
@@ -697,6 +737,7 @@ def handle_fight_auto(gui_app=None):
                         log("[Combat Auto] Bouton 'Passer son tour' non trouvé, appui sur F1 en fallback.")
                         time.sleep(2)
                         pyautogui.press('f1')
+                        frame_bus.invalidate()
                 else:
                     combat_is_finished = True
 
@@ -708,6 +749,7 @@ def handle_fight_auto(gui_app=None):
     time.sleep(3)
 
 def handle_fight(auto_combat_enabled=False, gui_app=None):
+    import winsound
     if auto_combat_enabled:
         handle_fight_auto(gui_app)
         if gui_app: gui_app.after(0, gui_app.draw_map, False)
@@ -3,11 +3,14 @@ import json
 import time
 import math
 import random
-import cv2
 import numpy as np
 import os
-from PIL import ImageGrab, Image
-from utils import log, is_red_present, check_and_close_levelup_popup, is_fight_started, check_for_pause, is_stop_requested
+import threading
+from PIL import Image
+from capture import frame_bus
+from templates import template_registry
+from vision import locate_template
+from utils import log, is_red_present, check_and_close_levelup_popup, is_fight_started, check_for_pause, is_stop_requested, image_file_lock
 from grid import grid_instance
 from fight import handle_fight
 
@@ -22,65 +25,262 @@ FISHING_START_DELAY = CONFIG["FISHING_START_DELAY"]
 CURSOR_RESET_DURATION = CONFIG["CURSOR_RESET_DURATION"]
 FLOTTEUR_TIMEOUT = CONFIG["FLOTTEUR_TIMEOUT"]
 FLOTTEUR_CHECK_INTERVAL = CONFIG["FLOTTEUR_CHECK_INTERVAL"]
+HOVER_FREE_SCAN = CONFIG.get("HOVER_FREE_SCAN", False)
+HOVER_FREE_MAX_DIFFERENCE = CONFIG.get("HOVER_FREE_MAX_DIFFERENCE", 25)
 
 # --- Constantes ---
 MAP_FOLDER = "Maps"
 IMAGE_FOLDER = "Images"
 PECHER_IMAGE = os.path.join(IMAGE_FOLDER, "button_fish.png")
+FLOAT_FAST_INTERVAL = 0.02  # Cadence (s) à l'approche de la touche attendue : environ une image
+FLOAT_SLOW_INTERVAL = 0.25  # Cadence (s) loin de la touche attendue
+FLOAT_FAST_WINDOW = 1.5  # Marge (s) avant la touche attendue où l'on repasse en cadence rapide
+FLOAT_HISTORY_SIZE = 10  # Durées de touche conservées pour la moyenne
+FLOAT_MISSES_FOR_BITE = 2  # Relevés consécutifs sans flotteur avant de conclure à une touche
+STOP_CHECK_INTERVAL = 0.1
+SPOT_PATCH_SIZE = 10  # Demi-côté (px) du patch comparé au fond de carte
+MAP_IMAGE_OFFSET = (0, 24)  # Les fonds de carte sont des captures de la zone de jeu (0, 24, 1348, 808)
+
+# --- Ordre de passage des points ---
+_route_cache = {}
+
+def _route_distances(points):
+    # Distances hexagonales entre cases ; None si un point est hors grille
+    if all(points):
+        return np.array([[grid_instance.get_hex_distance(a, b) for b in points] for a in points], dtype=np.float64)
+    return None
+
+def _two_opt(route, distances):
+    # Route ouverte dont le dernier élément (la sortie) reste fixe ; inversion de segments tant que cela raccourcit
+    improved = True
+    while improved:
+        improved = False
+        for i in range(len(route) - 2):
+            for j in range(i + 1, len(route) - 1):
+                before = distances[route[i - 1], route[i]] if i > 0 else 0.0
+                after = distances[route[i - 1], route[j]] if i > 0 else 0.0
+                delta = after + distances[route[i], route[j + 1]] - before - distances[route[j], route[j + 1]]
+                if delta < -1e-9:
+                    route[i:j + 1] = route[i:j + 1][::-1]
+                    improved = True
+    return route
+
+def plan_fishing_route(map_coords, cells, exit_screen_pos=None):
+    # Tournée courte passant par tous les points et finissant près de la sortie : plus proche voisin depuis la sortie, puis 2-opt
+    key = (map_coords, (exit_screen_pos['x'], exit_screen_pos['y']) if exit_screen_pos else None,
+           tuple((cell['x'], cell['y']) for cell in cells))
+    if key in _route_cache:
+        return _route_cache[key]
+    # Un seul point, ou deux sans sortie : l'ordre n'a pas d'importance
+    if len(cells) < 2 or (len(cells) == 2 and not exit_screen_pos):
+        _route_cache[key] = list(range(len(cells)))
+        return _route_cache[key]
+
+    screen_points = [(cell['x'], cell['y']) for cell in cells]
+    if exit_screen_pos:
+        screen_points.append((exit_screen_pos['x'], exit_screen_pos['y']))
+    distances = _route_distances(grid_instance.get_cells_from_screen_coords(screen_points))
+    if distances is None:
+        points = np.array(screen_points, dtype=np.float64)
+        distances = np.hypot(*(points[:, None, :] - points[None, :, :]).transpose(2, 0, 1)) / (grid_instance.cell_width / 2)
+
+    # Construction à rebours depuis la sortie (ou depuis le premier point du fichier sans sortie)
+    remaining = set(range(len(cells)))
+    current = len(cells) if exit_screen_pos else 0
+    backwards = [current]
+    remaining.discard(current)
+    while remaining:
+        current = min(remaining, key=lambda i: (distances[current, i], i))
+        backwards.append(current)
+        remaining.remove(current)
+    route = backwards[::-1]
+
+    if exit_screen_pos:
+        route = _two_opt(route, distances)[:-1]
+    else:
+        # Sans sortie, une sortie fictive à distance nulle de tous les points laisse la fin libre
+        padded = np.zeros((len(cells) + 1, len(cells) + 1))
+        padded[:-1, :-1] = distances
+        route = _two_opt(route + [len(cells)], padded)[:-1]
+
+    _route_cache[key] = route
+    return route
 
 # --- Fonctions de Pêche ---
 
-def capture_zone(x, y, size=10):
+def capture_zone(x, y, size=10, frame=None, max_age=None):
     box = (x - size, y - size, x + size, y + size)
-    img = ImageGrab.grab(bbox=box)
-    return np.array(img)
+    zone = frame.crop(box) if frame is not None else frame_bus.grab(bbox=box, max_age=max_age)
+    return zone.array
 
 def detect_change_raw(before, after):
     return not np.array_equal(before, after)
 
+# --- Détection des points actifs sans survol ---
+_map_references = {}
+
+def load_map_reference(map_coords):
+    # Fond de carte Maps/Images/{coords}Normal.png, relu seulement s'il a changé sur le disque
+    path = os.path.join(MAP_FOLDER, "Images", f"{map_coords}Normal.png")
+    if not os.path.exists(path):
+        return None
+    mtime = os.path.getmtime(path)
+    cached = _map_references.get(map_coords)
+    if cached is None or cached[0] != mtime:
+        with image_file_lock:
+            reference = np.asarray(Image.open(path).convert("RGB"))
+        _map_references[map_coords] = (mtime, reference)
+    return _map_references[map_coords][1]
+
+def scan_active_spots(map_coords, cells, frame=None):
+    # Un point est actif si son patch ressemble au fond enregistré ; None pour un point hors des images
+    reference = load_map_reference(map_coords)
+    if reference is None or not cells:
+        return None
+    if frame is None:
+        frame = frame_bus.grab()
+    live = frame.array
+
+    centers = np.array([(cell["x"], cell["y"]) for cell in cells], dtype=np.int64)
+    dy, dx = np.mgrid[-SPOT_PATCH_SIZE:SPOT_PATCH_SIZE + 1, -SPOT_PATCH_SIZE:SPOT_PATCH_SIZE + 1]
+    xs = centers[:, 0, None, None] + dx[None]
+    ys = centers[:, 1, None, None] + dy[None]
+
+    def patches(image, offset):
+        local_x, local_y = xs - offset[0], ys - offset[1]
+        height, width = image.shape[:2]
+        inside = ((local_x >= 0) & (local_x < width) & (local_y >= 0) & (local_y < height)).all(axis=(1, 2))
+        return image[np.clip(local_y, 0, height - 1), np.clip(local_x, 0, width - 1), :3].astype(np.int16), inside
+
+    live_patches, live_inside = patches(live, frame.offset)
+    reference_patches, reference_inside = patches(reference, MAP_IMAGE_OFFSET)
+    differences = np.abs(live_patches - reference_patches).mean(axis=(1, 2, 3))
+    return [bool(d <= HOVER_FREE_MAX_DIFFERENCE) if inside else None
+            for d, inside in zip(differences, live_inside & reference_inside)]
+
 def click_with_offset(x, y, offset_range=5, duration=0.05):
     offset_x = random.randint(-offset_range, offset_range)
     offset_y = random.randint(-offset_range, offset_range)
     pyautogui.moveTo(x + offset_x, y + offset_y, duration=duration)
     pyautogui.click()
+    frame_bus.invalidate()
 
 def reset_cursor_to_case(x, y):
     pyautogui.moveTo(x, y, duration=CURSOR_RESET_DURATION)
 
-def find_and_click_pecher_button(template_path=PECHER_IMAGE, threshold=PECHER_THRESHOLD, duration=0.05):
-    screen = ImageGrab.grab()
-    screen_gray = cv2.cvtColor(np.array(screen), cv2.COLOR_BGR2GRAY)
-    template = cv2.imread(template_path, 0)
-    w, h = template.shape[::-1]
-    res = cv2.matchTemplate(screen_gray, template, cv2.TM_CCOEFF_NORMED)
-    loc = np.where(res >= threshold)
-    for pt in zip(*loc[::-1]):
-        pyautogui.moveTo(pt[0] + w // 2, pt[1] + h // 2, duration=duration)
+def find_and_click_pecher_button(template_path=PECHER_IMAGE, threshold=PECHER_THRESHOLD, duration=0.05, frame=None):
+    template = template_registry.get(template_path)
+    if template is None:
+        return False
+    match = locate_template(template, threshold, frame=frame)
+    if match:
+        pyautogui.moveTo(match[0] + template.w // 2, match[1] + template.h // 2, duration=duration)
         pyautogui.click()
+        frame_bus.invalidate()
         return True
     return False
 
-def wait_for_fishing_cycle_color(x, y, min_delay=FISHING_DELAY_MIN, max_delay=FISHING_DELAY_MAX, timeout=FLOTTEUR_TIMEOUT):
+class FloatWatcher:
+    # --- Surveillance du flotteur dans son propre thread : événements d'apparition et de disparition ---
+    def __init__(self):
+        self.appeared = threading.Event()
+        self.disappeared = threading.Event()
+        self.appeared_at = None
+        self.bite_durations = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def expected_bite_time(self):
+        # Durée moyenne apparition -> disparition observée sur les dernières pêches
+        if not self.bite_durations:
+            return None
+        return sum(self.bite_durations) / len(self.bite_durations)
+
+    def _poll_interval(self):
+        if self.appeared_at is None:
+            return FLOAT_FAST_INTERVAL
+        expected = self.expected_bite_time()
+        if expected is None:
+            return FLOTTEUR_CHECK_INTERVAL
+        remaining = expected - (time.time() - self.appeared_at)
+        return FLOAT_FAST_INTERVAL if remaining <= FLOAT_FAST_WINDOW else min(FLOAT_SLOW_INTERVAL, remaining - FLOAT_FAST_WINDOW)
+
+    def start(self, x, y, timeout=FLOTTEUR_TIMEOUT, min_delay=0):
+        self.stop()
+        self.appeared.clear()
+        self.disappeared.clear()
+        self.appeared_at = None
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(x, y, timeout, min_delay), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread and self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1)
+        self._thread = None
+
+    def _run(self, x, y, timeout, min_delay):
+        # La disparition n'est prise en compte qu'après min_delay, et sur plusieurs relevés (flotteur qui bouge, curseur)
+        deadline = time.time() + 2 * timeout
+        misses, first_miss = 0, None
+        while not self._stop.is_set() and time.time() < deadline:
+            try:
+                present = is_red_present(x, y, frame=frame_bus.grab(bbox=(x - 10, y - 10, x + 10, y + 10), cache=False))
+            except Exception as e:
+                log(f"Erreur de surveillance du flotteur : {e}")
+                return
+            if present and not self.appeared.is_set():
+                self.appeared_at = time.time()
+                self.appeared.set()
+            elif not present and self.appeared.is_set() and time.time() - self.appeared_at >= min_delay:
+                misses, first_miss = misses + 1, first_miss or time.time()
+                if misses >= FLOAT_MISSES_FOR_BITE:
+                    self.bite_durations = (self.bite_durations + [first_miss - self.appeared_at])[-FLOAT_HISTORY_SIZE:]
+                    self.disappeared.set()
+                    return
+            elif present:
+                misses, first_miss = 0, None
+            self._stop.wait(self._poll_interval())
+
+float_watcher = FloatWatcher()
+
+def wait_for_float_event(event, timeout, stop_message):
+    # Réagit dès que l'événement est signalé, tout en surveillant l'arrêt d'urgence
     start = time.time()
     while time.time() - start < timeout:
         if is_stop_requested():
-            log("Arrêt d'urgence pendant la détection du flotteur.")
+            log(stop_message)
+            return None
+        if event.wait(STOP_CHECK_INTERVAL):
+            return True
+    return False
+
+def wait_for_fishing_cycle_color(x, y, min_delay=FISHING_DELAY_MIN, max_delay=FISHING_DELAY_MAX, timeout=FLOTTEUR_TIMEOUT, on_idle=None):
+    float_watcher.start(x, y, timeout, min_delay)
+    try:
+        appeared = wait_for_float_event(float_watcher.appeared, timeout, "Arrêt d'urgence pendant la détection du flotteur.")
+        if appeared is None:
             return False
-        if is_red_present(x, y):
-            break
-        time.sleep(FLOTTEUR_CHECK_INTERVAL)
 
-    log(f"Pêche en cours... Attente d'au moins {min_delay}s.")
-    time.sleep(min_delay)
-    start = time.time()
-    while time.time() - start < timeout:
-        if is_stop_requested():
-            log("Arrêt d'urgence pendant la pêche.")
+        log(f"Pêche en cours... Attente d'au moins {min_delay}s.")
+        # Le temps d'attente sert à préparer la suite (analyse des points), sans l'allonger
+        idle_start = time.time()
+        if on_idle:
+            on_idle()
+        time.sleep(max(0, min_delay - (time.time() - idle_start)))
+        if not appeared:
+            log("Reprise du scan.")
+            return True
+
+        disappeared = wait_for_float_event(float_watcher.disappeared, timeout, "Arrêt d'urgence pendant la pêche.")
+        if disappeared is None:
             return False
-        if not is_red_present(x, y):
+        if disappeared:
             log("Reprise du scan.")
             return True
-        time.sleep(FLOTTEUR_CHECK_INTERVAL)
+    finally:
+        float_watcher.stop()
 
     delay = random.uniform(min_delay, max_delay)
     log(f"Reprise du scan (timeout). Attente forcée de {delay:.2f}s.")
@@ -96,22 +296,31 @@ def run_fishing_cycle(map_coords, map_data, gui_app, target_direction):
 
     if target_direction and target_direction in exits:
         log(f"Optimisation du trajet vers la sortie '{target_direction}'.")
-        exit_screen_pos = exits[target_direction]
-        exit_grid_cell = grid_instance.get_cell_from_screen_coords(exit_screen_pos['x'], exit_screen_pos['y'])
-
-        def distance_to_exit(cell):
-            cell_grid_pos = grid_instance.get_cell_from_screen_coords(cell['x'], cell['y'])
-            return grid_instance.get_distance(cell_grid_pos, exit_grid_cell) if cell_grid_pos and exit_grid_cell else float('inf')
-
-        cells.sort(key=distance_to_exit, reverse=True)
+        cells = [cells[i] for i in plan_fishing_route(map_coords, cells, exits[target_direction])]
     else:
-        log("Aucune sortie planifiée, parcours des points dans l'ordre du fichier.")
+        log("Aucune sortie planifiée, optimisation du trajet entre les points.")
+        cells = [cells[i] for i in plan_fishing_route(map_coords, cells)]
 
     if is_stop_requested():
         return False
 
+    # Mode sans survol : un seul passage sur tous les points, puis visite des seuls points actifs
+    spot_states = {}
+    def refresh_spot_states():
+        states = scan_active_spots(map_coords, cells)
+        spot_states.clear()
+        if states is not None:
+            spot_states.update((id(cell), state) for cell, state in zip(cells, states))
+
+    if HOVER_FREE_SCAN:
+        refresh_spot_states()
+        if spot_states:
+            log(f"Analyse sans survol : {sum(1 for state in spot_states.values() if state)} point(s) actif(s) sur {len(cells)}.")
+
     for cell in cells:
-        if is_fight_started():
+        # Une capture par tick : partagée entre la détection de combat et l'état "avant survol"
+        frame = frame_bus.grab()
+        if is_fight_started(frame=frame, pyramid=True):
             log("COMBAT DÉTECTÉ (agression) ! Lancement de la gestion du combat.")
             auto_combat_enabled = gui_app.auto_combat_var.get()
             handle_fight(auto_combat_enabled, gui_app)
@@ -120,16 +329,23 @@ def run_fishing_cycle(map_coords, map_data, gui_app, target_direction):
 
         check_for_pause()
         x, y = cell["x"], cell["y"]
+        spot_state = spot_states.get(id(cell))
+        if spot_state is False:
+            continue
 
         gui_app.after(0, gui_app.highlight_spot, cell, "orange")
 
-        before = capture_zone(x, y)
-        pyautogui.moveTo(x, y, duration=0.05)
-        time.sleep(0.05)
-        after = capture_zone(x, y)
+        if spot_state:
+            spot_found = True
+        else:
+            before = capture_zone(x, y, frame=frame)
+            pyautogui.moveTo(x, y, duration=0.05)
+            time.sleep(0.05)
+            after = capture_zone(x, y, max_age=0)
+            spot_found = detect_change_raw(before, after)
 
         is_fishing = False
-        if detect_change_raw(before, after):
+        if spot_found:
             log(f"Poisson trouvé à ({x}, {y})")
             click_with_offset(x, y, duration=0.05)
 
@@ -137,10 +353,12 @@ def run_fishing_cycle(map_coords, map_data, gui_app, target_direction):
                 reset_cursor_to_case(x, y)
                 gui_app.after(0, gui_app.highlight_spot, cell, "lightgreen")
                 
-                is_fishing = wait_for_fishing_cycle_color(x, y, min_delay=FISHING_START_DELAY)
+                is_fishing = wait_for_fishing_cycle_color(x, y, min_delay=FISHING_START_DELAY,
+                                                          on_idle=refresh_spot_states if spot_states else None)
                 
-                check_and_close_levelup_popup()
-                if is_fight_started():
+                frame = frame_bus.grab()
+                check_and_close_levelup_popup(frame=frame)
+                if is_fight_started(frame=frame):
                     auto_combat_enabled = gui_app.auto_combat_var.get()
                     handle_fight(auto_combat_enabled, gui_app)
                     log("Reprise du cycle de pêche après le combat. Redémarrage du scan sur la carte actuelle.")
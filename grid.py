@@ -1,11 +1,128 @@
 import os
-import pyautogui
-import keyboard
 import cv2
 import numpy as np
 from tkinter import messagebox
 import heapq
 from utils import log
+from capture import frame_bus
+from world import world_graph
+
+# --- Constantes ---
+GAME_AREA = (0, 24, 1348, 808)
+VISIBLE_CELL_MARGIN = 20  # Marge (px) autour de la zone de jeu : cases dont les zones d'échantillonnage débordent à l'écran
+NEIGHBOR_OFFSETS = ((1, 0), (-1, 0), (0, 1), (0, -1), (1, -1), (-1, 1))
+
+class CellSet:
+    # --- Ensemble de cases stocké comme masque booléen indexé par identifiant de case (voir Grid.cell_ids) ---
+    def __init__(self, grid):
+        self.grid = grid
+        self.mask = np.zeros(0, dtype=bool)
+
+    def reset(self):
+        self.mask = np.zeros(len(self.grid._cell_keys), dtype=bool)
+
+    def __contains__(self, cell):
+        index = self.grid.cell_ids.get(cell)
+        return index is not None and bool(self.mask[index])
+
+    def __iter__(self):
+        keys = self.grid._cell_keys
+        return (keys[i] for i in np.flatnonzero(self.mask))
+
+    def __len__(self):
+        return int(np.count_nonzero(self.mask))
+
+    def add(self, cell):
+        # Une case hors de la zone visible n'a pas d'identifiant : ignorée
+        index = self.grid.cell_ids.get(cell)
+        if index is not None:
+            self.mask[index] = True
+
+    def discard(self, cell):
+        index = self.grid.cell_ids.get(cell)
+        if index is not None:
+            self.mask[index] = False
+
+    def update(self, cells):
+        for cell in cells:
+            self.add(cell)
+
+    def clear(self):
+        self.mask[:] = False
+
+class ReachabilityField:
+    # --- Distances et prédécesseurs de toutes les cases atteignables depuis une case (Dijkstra, coûts 1 ou 2) ---
+    def __init__(self, grid, start_id):
+        self.grid = grid
+        self.start_id = start_id
+        self.mask = grid.walkable_cells.mask.copy()
+        walkable = self.mask.tolist()
+        neighbor_costs = grid._neighbor_costs
+
+        costs = [float('inf')] * len(walkable)
+        previous = [-1] * len(walkable)
+        costs[start_id] = 0
+        queue = [(0, start_id)]
+        while queue:
+            cost, current = heapq.heappop(queue)
+            if cost > costs[current]:
+                continue
+            for neighbor, move_cost in neighbor_costs[current]:
+                candidate = cost + move_cost
+                if walkable[neighbor] and candidate < costs[neighbor]:
+                    costs[neighbor] = candidate
+                    previous[neighbor] = current
+                    heapq.heappush(queue, (candidate, neighbor))
+        self.costs = costs
+        self.previous = previous
+        self.reached = np.flatnonzero(np.isfinite(costs))
+
+    def is_valid_for(self, start_id):
+        return self.start_id == start_id and np.array_equal(self.mask, self.grid.walkable_cells.mask)
+
+    def cost_to(self, cell):
+        index = self.grid.cell_ids.get(cell)
+        return self.costs[index] if index is not None else float('inf')
+
+    def cells_within(self, max_cost):
+        # Cases atteignables pour au plus max_cost PM : liste de (case, coût)
+        keys = self.grid._cell_keys
+        return [(keys[i], self.costs[i]) for i in self.reached.tolist() if self.costs[i] <= max_cost]
+
+    def closest_to(self, cell):
+        # Case atteinte la plus proche de la cible (get_distance) ; à égalité, la moins coûteuse : la cible elle-même si atteinte
+        grid = self.grid
+        index = grid.cell_ids.get(cell)
+        if index is not None and self.costs[index] != float('inf'):
+            return index
+        if index is not None:
+            distances = grid.distance_table[index, self.reached]
+        else:
+            distances = np.abs(grid.cell_coords[self.reached] - np.array(cell, dtype=np.int32)).sum(axis=1)
+        candidates = self.reached[distances == distances.min()]
+        return int(min(candidates, key=lambda i: (self.costs[i], i)))
+
+    def _path_ids(self, index):
+        path = []
+        while index != -1:
+            path.append(index)
+            index = self.previous[index]
+        return path[::-1]
+
+    def path_to(self, cell):
+        # Même contrat que Grid.find_path : chemin vers la cible, ou vers la case atteinte la plus proche
+        keys = self.grid._cell_keys
+        return [keys[i] for i in self._path_ids(self.closest_to(cell))]
+
+    def path_length(self, cell):
+        return len(self._path_ids(self.closest_to(cell))) - 1
+
+    def farthest_toward(self, cell, max_cost):
+        # Dernière case du chemin vers la cible dont le coût reste dans max_cost (get_farthest_walkable_cell)
+        index = self.closest_to(cell)
+        while self.costs[index] > max_cost:
+            index = self.previous[index]
+        return self.grid._cell_keys[index]
 
 class Grid:
     # --- Initialisation et Configuration ---
@@ -17,10 +134,21 @@ class Grid:
         self.cells = {}
         self.cell_width = 96.5
         self.cell_height = 49.5
-        self.walkable_cells = set()
-        self.los_transparent_cells = set()
+        self.cell_ids = {}  # (q, r) -> identifiant entier de la case visible
+        self.cell_coords = np.zeros((0, 2), dtype=np.int32)
+        self.neighbor_table = np.zeros((0, len(NEIGHBOR_OFFSETS)), dtype=np.int32)
+        self.distance_table = np.zeros((0, 0), dtype=np.int16)
+        self.hex_distance_table = np.zeros((0, 0), dtype=np.int16)
+        self._neighbor_costs = []
+        self.walkable_cells = CellSet(self)
+        self.los_transparent_cells = CellSet(self)
         self.walkable_cell_colors_rgb = []
         self.combat_overrides = {}
+        self._cell_keys = []
+        self._label_maps = {}
+        self._reachability = None
+        self._visibility = None
+        self._line_cache = {}  # (dq, dr, parité q, parité r) -> cases traversées par la ligne de vue
         self.load_config()
 
     def load_config(self):
@@ -102,6 +230,7 @@ class Grid:
         return c1 is not None and c2 is not None and all(abs(c1[i] - c2[i]) <= tolerance for i in range(3))
 
     def _wait_for_click(self):
+        import pyautogui, keyboard
         import time
         while True:
             if keyboard.is_pressed('enter'):
@@ -110,7 +239,7 @@ class Grid:
         return pyautogui.position()
 
     def _find_cell_center_from_point(self, start_pos):
-        screenshot = pyautogui.screenshot()
+        screenshot = frame_bus.grab(max_age=0).image
         if not (0 <= start_pos[0] < screenshot.width and 0 <= start_pos[1] < screenshot.height):
             raise ValueError(f"Le point de départ {start_pos} est hors de l'écran.")
         start_color_tuple = screenshot.getpixel(start_pos)
@@ -144,31 +273,104 @@ class Grid:
             return
 
         self.map_radius = 25
-        self.cells.clear()
+        lattice = {}
         for r in range(-self.map_radius, self.map_radius + 1):
             for q in range(-self.map_radius, self.map_radius + 1):
                 x = self.origin[0] + q * self.u_vec[0] + r * self.v_vec[0]
                 y = self.origin[1] + q * self.u_vec[1] + r * self.v_vec[1]
-                self.cells[(q, r)] = (int(x), int(y))
+                lattice[(q, r)] = (int(x), int(y))
+        self._label_maps.clear()
+
+        # Transformée inverse du réseau origin/u_vec/v_vec pour la recherche écran -> case en O(1)
+        basis = np.array([[self.u_vec[0], self.v_vec[0]], [self.u_vec[1], self.v_vec[1]]], dtype=np.float64)
+        self._inverse_basis = np.linalg.inv(basis)
+        side = 2 * self.map_radius + 1
+        self._lattice_keys = list(lattice.keys())
+        self._lattice_positions = np.array(list(lattice.values()), dtype=np.float64)
+        self._position_grid = self._lattice_positions.reshape(side, side, 2)
+        self._neighborhood = np.array([(dq, dr) for dr in (-1, 0, 1) for dq in (-1, 0, 1)], dtype=np.int64)
+
+        # Seules les cases visibles sont conservées ; identifiants dans l'ordre (q, r) pour garder l'ordre des tuples
+        x0, y0, x1, y1 = GAME_AREA
+        margin = VISIBLE_CELL_MARGIN
+        self._cell_keys = sorted(cell for cell, (x, y) in lattice.items()
+                                 if x0 - margin <= x < x1 + margin and y0 - margin <= y < y1 + margin)
+        self.cells = {cell: lattice[cell] for cell in self._cell_keys}
+        self.cell_ids = {cell: index for index, cell in enumerate(self._cell_keys)}
+        self.cell_coords = np.array(self._cell_keys, dtype=np.int32).reshape(-1, 2)
+
+        # Voisins (-1 si hors zone visible) et coût de déplacement vers chacun
+        self.neighbor_table = np.array([[self.cell_ids.get((q + dq, r + dr), -1) for dq, dr in NEIGHBOR_OFFSETS]
+                                        for q, r in self._cell_keys], dtype=np.int32).reshape(-1, len(NEIGHBOR_OFFSETS))
+        self._neighbor_costs = [[(neighbor, abs(dq) + abs(dr)) for neighbor, (dq, dr) in zip(row, NEIGHBOR_OFFSETS) if neighbor >= 0]
+                                for row in self.neighbor_table.tolist()]
+
+        # Tables de distances entre toutes les cases visibles : get_distance et get_hex_distance
+        dq = self.cell_coords[:, None, 0] - self.cell_coords[None, :, 0]
+        dr = self.cell_coords[:, None, 1] - self.cell_coords[None, :, 1]
+        self.distance_table = (np.abs(dq) + np.abs(dr)).astype(np.int16)
+        self.hex_distance_table = ((np.abs(dq) + np.abs(dr) + np.abs(dq + dr)) // 2).astype(np.int16)
+
+        self.walkable_cells.reset()
+        self.los_transparent_cells.reset()
+        log(f"[Grille] {len(self._cell_keys)} cases visibles sur {len(lattice)}.")
+
+    def get_cells_from_screen_coords(self, points):
+        # Version groupée : points (N x 2) -> liste de N cases, même résultat qu'une recherche linéaire sur le réseau complet
+        if not self.is_calibrated:
+            return [None] * len(points)
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if len(points) == 0:
+            return []
+
+        lattice = (points - np.asarray(self.origin, dtype=np.float64)) @ self._inverse_basis.T
+        rounded = np.rint(lattice).astype(np.int64)
+        radius = self.map_radius
+        clamped = np.clip(rounded, -radius, radius)
+
+        # Case la plus proche parmi les 9 voisines de l'arrondi ; à égalité, la première dans l'ordre r puis q du réseau
+        # (celui de _lattice_keys, pas l'ordre (q, r) de self.cells)
+        candidates = clamped[:, None, :] + self._neighborhood[None, :, :]
+        valid = np.all(np.abs(candidates) <= radius, axis=-1)
+        grid_q = np.clip(candidates[..., 0], -radius, radius) + radius
+        grid_r = np.clip(candidates[..., 1], -radius, radius) + radius
+        positions = self._position_grid[grid_r, grid_q]
+        distances = np.hypot(points[:, None, 0] - positions[..., 0], points[:, None, 1] - positions[..., 1])
+        distances[~valid] = np.inf
+        best = candidates[np.arange(len(points)), np.argmin(distances, axis=1)]
+
+        # Points hors du losange de la grille : recherche exhaustive vectorisée
+        outside = np.flatnonzero(np.any(clamped != rounded, axis=1))
+        for i in outside:
+            all_distances = np.hypot(points[i, 0] - self._lattice_positions[:, 0], points[i, 1] - self._lattice_positions[:, 1])
+            best[i] = self._lattice_keys[int(np.argmin(all_distances))]
+
+        return [(int(q), int(r)) for q, r in best]
 
     def get_cell_from_screen_coords(self, x, y):
         if not self.is_calibrated:
             return None
-
-        import math
-        closest_cell = None
-        min_dist = float('inf')
-
-        for cell_coord, screen_pos in self.cells.items():
-            dist = math.hypot(x - screen_pos[0], y - screen_pos[1])
-            if dist < min_dist:
-                min_dist = dist
-                closest_cell = cell_coord
-        
-        return closest_cell
+        return self.get_cells_from_screen_coords([(x, y)])[0]
     
     # --- Logique de Combat ---
-    def map_obstacles(self, screenshot=None, **kwargs):
+    def _get_label_map(self, shape, y_offset, half_size=3):
+        # Carte d'étiquettes : chaque pixel échantillonné (carré 7x7 décalé de y_offset) porte l'index de sa case
+        key = (shape, y_offset, half_size)
+        if key not in self._label_maps:
+            height, width = shape
+            labels = np.full(shape, -1, dtype=np.int32)
+            for index, cell_coord in enumerate(self._cell_keys):
+                x, y = self.cells[cell_coord]
+                y += y_offset
+                x0, x1 = max(0, x - half_size), min(width, x + half_size + 1)
+                y0, y1 = max(0, y - half_size), min(height, y + half_size + 1)
+                if x0 < x1 and y0 < y1:
+                    labels[y0:y1, x0:x1] = index
+            ys, xs = np.nonzero(labels >= 0)
+            self._label_maps[key] = (ys, xs, labels[ys, xs])
+        return self._label_maps[key]
+
+    def map_obstacles(self, screenshot=None, frame=None, **kwargs):
         if not self.cells:
             log("[Grille] Impossible de mapper les obstacles : grille non étalonnée ou couleurs tactiques non définies.")
             return
@@ -177,71 +379,34 @@ class Grid:
         self.los_transparent_cells.clear()
         
         map_coords = kwargs.get('map_coords')
-        self.combat_overrides = {}
-        if map_coords:
-            try:
-                import json
-                map_path = os.path.join("Maps", f"{map_coords}.json")
-                if os.path.exists(map_path):
-                    with open(map_path, 'r') as f:
-                        map_data = json.load(f)
-                        self.combat_overrides = map_data.get("combat_overrides", {})
-            except Exception as e:
-                log(f"[Grille] Erreur au chargement des overrides: {e}")
+        # Remplacements déjà convertis en cases (q, r) par le graphe des cartes
+        self.combat_overrides = world_graph.get_overrides(map_coords) if map_coords else {}
 
-        if screenshot is None:
-            screenshot = pyautogui.screenshot()
-        
-        scan_moves = [(0, 0)]
-        for i in range(1, 4):
-            for dx in range(-i, i + 1):
-                scan_moves.append((dx, i))
-                scan_moves.append((dx, -i))
-            for dy in range(-i + 1, i):
-                scan_moves.append((i, dy))
-                scan_moves.append((-i, dy))
-
-        for cell_coord, screen_pos in self.cells.items():
-            walkable_pixel_count = 0
-            hole_pixel_count = 0
-
-            y_offset_walkable = -15
-            for dx, dy in scan_moves:
-                scan_x, scan_y = screen_pos[0] + dx, screen_pos[1] + y_offset_walkable + dy
-                if not (0 <= scan_x < screenshot.width and 0 <= scan_y < screenshot.height):
-                    continue
-                try:
-                    pixel_rgb = screenshot.getpixel((scan_x, scan_y))
-                    for target_color in self.walkable_cell_colors_rgb:
-                        if all(abs(pixel_rgb[i] - target_color[i]) <= 15 for i in range(3)):
-                            walkable_pixel_count += 1
-                            break
-                except IndexError:
-                    pass
-
-            if walkable_pixel_count >= 5:
-                self.walkable_cells.add(cell_coord)
-                self.los_transparent_cells.add(cell_coord)
-                continue
+        if frame is not None:
+            image = frame.array
+        else:
+            if screenshot is None:
+                screenshot = frame_bus.grab(max_age=0).image
+            image = np.asarray(screenshot)
 
-            y_offset_hole = 10
-            for dx, dy in scan_moves:
-                scan_x, scan_y = screen_pos[0] + dx, screen_pos[1] + y_offset_hole + dy
-                if not (0 <= scan_x < screenshot.width and 0 <= scan_y < screenshot.height): continue
-                try:
-                    pixel_rgb = screenshot.getpixel((scan_x, scan_y))
-                    if all(c <= 15 for c in pixel_rgb):
-                        hole_pixel_count += 1
-                except IndexError:
-                    pass
-            
-            if hole_pixel_count >= 5:
-                self.los_transparent_cells.add(cell_coord)
+        # Comptage de tous les pixels échantillonnés en une passe : masque de couleur + np.bincount par case
+        cell_count = len(self._cell_keys)
+        ys, xs, ids = self._get_label_map(image.shape[:2], -15)
+        pixels = image[ys, xs, :3].astype(np.int16)
+        colors = np.array(self.walkable_cell_colors_rgb, dtype=np.int16).reshape(1, -1, 3)
+        walkable_hits = np.any(np.all(np.abs(pixels[:, None, :] - colors) <= 15, axis=-1), axis=-1)
+        walkable_counts = np.bincount(ids[walkable_hits], minlength=cell_count)
+
+        ys, xs, ids = self._get_label_map(image.shape[:2], 10)
+        hole_hits = np.all(image[ys, xs, :3] <= 15, axis=-1)
+        hole_counts = np.bincount(ids[hole_hits], minlength=cell_count)
+
+        self.walkable_cells.mask = walkable_counts >= 5
+        self.los_transparent_cells.mask = self.walkable_cells.mask | (hole_counts >= 5)
 
         if self.combat_overrides:
             log(f"[Grille] Application de {len(self.combat_overrides)} remplacements de combat.")
-            for cell_str, state in self.combat_overrides.items():
-                cell_coord = tuple(map(int, cell_str.strip('()').split(',')))
+            for cell_coord, state in self.combat_overrides.items():
                 if state == "walkable":
                     self.walkable_cells.add(cell_coord)
                     self.los_transparent_cells.add(cell_coord)
@@ -254,27 +419,26 @@ class Grid:
         log(f"[Grille] Cartographie terminée : {len(self.walkable_cells)} cases marchables trouvées.")
 
     def get_neighbors(self, cell):
-        q, r = cell
-        neighbors = [
-            (q + 1, r), (q - 1, r), (q, r + 1), (q, r - 1),
-            (q + 1, r - 1), (q - 1, r + 1)
-        ]
-        return [n for n in neighbors if n in self.walkable_cells]
+        index = self.cell_ids.get(cell)
+        if index is None:
+            return []
+        walkable, keys = self.walkable_cells.mask, self._cell_keys
+        return [keys[n] for n, _ in self._neighbor_costs[index] if walkable[n]]
 
     def get_distance(self, cell1, cell2):
         if cell1 == cell2:
             return 0
+        id1, id2 = self.cell_ids.get(cell1), self.cell_ids.get(cell2)
+        if id1 is not None and id2 is not None:
+            return int(self.distance_table[id1, id2])
+        # Case hors de la zone visible : calcul direct
         q1, r1 = cell1
         q2, r2 = cell2
         return abs(q1 - q2) + abs(r1 - r2)
 
     def get_path_distance(self, start, end):
-        path = self.find_path(start, end)
-        if path and len(path) > 1:
-            return len(path) - 1
-        elif path and len(path) == 1:
-            return 0
-        return float('inf')
+        field = self.reachability(start)
+        return field.path_length(end) if field else float('inf')
 
     def get_move_cost(self, cell1, cell2):
         q1, r1 = cell1
@@ -295,85 +459,90 @@ class Grid:
         return path[-1]
 
     # --- Calculs pour la Grille Hexagonale ---
-    def _axial_to_cube(self, cell):
-        q, r = cell
-        return (q, r, -q - r)
-
-    def _cube_round(self, cube):
-        rx, ry, rz = round(cube[0]), round(cube[1]), round(cube[2])
-        x_diff, y_diff, z_diff = abs(rx - cube[0]), abs(ry - cube[1]), abs(rz - cube[2])
-        if x_diff > y_diff and x_diff > z_diff:
-            rx = -ry - rz
-        elif y_diff > z_diff:
-            ry = -rx - rz
-        else:
-            rz = -rx - ry
-        return (int(rx), int(ry), int(rz))
-
-    def _cube_to_axial(self, cube):
-        return (cube[0], cube[1])
-
-    def has_line_of_sight(self, start, end):
-        if start == end:
-            return True
-            
-        n = self.get_distance(start, end)
-        if n == 0: return True
-
-        start_cube = self._axial_to_cube(start)
-        end_cube = self._axial_to_cube(end)
-        
-        line_cells = []
-        for i in range(1, n):
-            interp_cube = tuple(start_cube[j] + (end_cube[j] - start_cube[j]) * i / n for j in range(3))
-            line_cells.append(self._cube_to_axial(self._cube_round(interp_cube)))
-            
-        for cell in line_cells:
-            if cell != start and cell != end and cell not in self.los_transparent_cells:
-                log(f"[Debug LdV] Ligne de vue de {start} à {end} bloquée par {cell}.")
+    def get_hex_distance(self, cell1, cell2):
+        # Distance hexagonale réelle (coordonnées cubiques), contrairement à get_distance
+        id1, id2 = self.cell_ids.get(cell1), self.cell_ids.get(cell2)
+        if id1 is not None and id2 is not None:
+            return int(self.hex_distance_table[id1, id2])
+        dq, dr = cell1[0] - cell2[0], cell1[1] - cell2[1]
+        return (abs(dq) + abs(dr) + abs(dq + dr)) // 2
+
+    def _line_offsets(self, dq, dr, q_parity, r_parity):
+        # Cases traversées par la ligne (hors extrémités), relatives au départ : interpolation cubique arrondie,
+        # calculée en entiers (numérateurs sur n). L'arrondi au pair ne dépend que de la parité du départ,
+        # d'où la clé (décalage, parités)
+        key = (dq, dr, q_parity, r_parity)
+        if key not in self._line_cache:
+            start = (q_parity, r_parity, -q_parity - r_parity)
+            delta = (dq, dr, -dq - dr)
+            n = abs(dq) + abs(dr)
+            offsets = []
+            for i in range(1, n):
+                numerators = [start[j] * n + delta[j] * i for j in range(3)]
+                rounded = []
+                for numerator in numerators:
+                    quotient, remainder = divmod(numerator, n)
+                    if 2 * remainder > n or (2 * remainder == n and quotient & 1):
+                        quotient += 1
+                    rounded.append(quotient)
+                rx, ry, rz = rounded
+                x_diff, y_diff, z_diff = (abs(rounded[j] * n - numerators[j]) for j in range(3))
+                if x_diff > y_diff and x_diff > z_diff:
+                    rx = -ry - rz
+                elif y_diff > z_diff:
+                    ry = -rx - rz
+                cell = (rx - q_parity, ry - r_parity)
+                if cell != (0, 0) and cell != (dq, dr):
+                    offsets.append(cell)
+            self._line_cache[key] = tuple(offsets)
+        return self._line_cache[key]
+
+    def _line_is_clear(self, start, end, transparent):
+        q, r = start
+        cell_ids = self.cell_ids
+        for dq, dr in self._line_offsets(end[0] - q, end[1] - r, q & 1, r & 1):
+            index = cell_ids.get((q + dq, r + dr))
+            if index is None or not transparent[index]:
                 return False
         return True
 
-    def find_path(self, start, end):
-        if start not in self.walkable_cells:
+    def visibility_from(self, start):
+        # Masque des cases visibles depuis start, calculé une fois par case et par état de los_transparent_cells
+        start_id = self.cell_ids.get(start)
+        if start_id is None:
             return None
+        mask = self.los_transparent_cells.mask
+        if self._visibility is None or self._visibility[0] != start_id or not np.array_equal(self._visibility[1], mask):
+            transparent = mask.tolist()
+            visible = np.array([self._line_is_clear(start, cell, transparent) for cell in self._cell_keys], dtype=bool)
+            self._visibility = (start_id, mask.copy(), visible)
+        return self._visibility[2]
+
+    def lines_of_sight(self, starts, end):
+        # Ligne de vue de plusieurs cases vers une même cible, sans toucher au cache de visibility_from
+        transparent = self.los_transparent_cells.mask.tolist()
+        return [start == end or self._line_is_clear(start, end, transparent) for start in starts]
 
-        frontier = [(0, start)]
-        came_from = {start: None}
-        cost_so_far = {start: 0}
-
-        while frontier:
-            current_priority, current = heapq.heappop(frontier)
-
-            if current == end and current in self.walkable_cells:
-                break
-            
-            for next_cell in self.get_neighbors(current):
-                new_cost = cost_so_far[current] + self.get_move_cost(current, next_cell)
-                if next_cell not in cost_so_far or new_cost < cost_so_far[next_cell]:
-                    cost_so_far[next_cell] = new_cost
-                    priority = new_cost + self.get_distance(end, next_cell)
-                    heapq.heappush(frontier, (priority, next_cell))
-                    came_from[next_cell] = current
-
-        closest_cell_to_target = start
-        min_dist_to_target = self.get_distance(start, end)
-
-        for cell in cost_so_far:
-            dist = self.get_distance(cell, end)
-            if dist < min_dist_to_target:
-                min_dist_to_target = dist
-                closest_cell_to_target = cell
-
-        if closest_cell_to_target is None:
+    def has_line_of_sight(self, start, end):
+        if start == end:
+            return True
+        end_id = self.cell_ids.get(end)
+        visible = self.visibility_from(start) if end_id is not None else None
+        if visible is None:
+            return self._line_is_clear(start, end, self.los_transparent_cells.mask.tolist())
+        return bool(visible[end_id])
+
+    def reachability(self, start):
+        # Champ calculé une fois par case de départ ; recalculé si la case ou les cases marchables changent
+        start_id = self.cell_ids.get(start)
+        if start_id is None or not self.walkable_cells.mask[start_id]:
             return None
+        if self._reachability is None or not self._reachability.is_valid_for(start_id):
+            self._reachability = ReachabilityField(self, start_id)
+        return self._reachability
 
-        path = []
-        current = closest_cell_to_target
-        while current is not None:
-            path.append(current)
-            current = came_from.get(current)
-        
-        return path[::-1] if path else None
+    def find_path(self, start, end):
+        field = self.reachability(start)
+        return field.path_to(end) if field else None
 
 grid_instance = Grid()
\ No newline at end of file
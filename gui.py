@@ -12,6 +12,9 @@ import os, sys, traceback
 from main import main_bot_logic, load_map_data, create_map_interactively, find_exit_with_fallback, wait_for_map_change, get_next_map_coords 
 from utils import log, set_pause_state, set_stop_state, is_stop_requested, is_fight_started, get_map_coordinates, image_file_lock
 from grid import grid_instance
+from world import world_graph
+from map_store import map_store
+from capture import frame_bus
 from fight import combat_state
 
 class GuiApp(tk.Tk):
@@ -490,15 +493,15 @@ class GuiApp(tk.Tk):
             messagebox.showerror("Erreur", "Impossible de lire les coordonnées de la carte actuelle.")
             return
         
-        map_exists = os.path.exists(f"Maps/{coords}.json")
+        map_exists = world_graph.has_map(coords)
         mode_text = "modifier" if map_exists else "créer"
         
         if messagebox.askyesno(f"{mode_text.capitalize()} la carte", f"Voulez-vous {mode_text} les données de la carte {coords} ?"):
             threading.Thread(target=create_map_interactively, args=(coords, None, map_exists), daemon=True).start()
 
-    def update_map_button_text(self):
-        coords = get_map_coordinates()
-        map_exists = os.path.exists(f"Maps/{coords}.json") if coords else False
+    def update_map_button_text(self, coords=None):
+        coords = coords or get_map_coordinates()
+        map_exists = world_graph.has_map(coords) if coords else False
         button_text = "Éditer la Map" if map_exists else "Créer la Map"
         self.add_edit_map_button.config(text=button_text)
 
@@ -537,7 +540,7 @@ class GuiApp(tk.Tk):
                 if not os.path.exists(normal_path):
                     # Si l'image normale n'existe pas, on la crée
                     log(f"[GUI] Le fichier {normal_path} n'existe pas. Création automatique...")
-                    temp_screenshot = pyautogui.screenshot().crop(game_area)
+                    temp_screenshot = frame_bus.grab(bbox=game_area).image
                     with image_file_lock:
                         temp_screenshot.save(normal_path)
                     game_screenshot = temp_screenshot
@@ -547,8 +550,7 @@ class GuiApp(tk.Tk):
                         game_screenshot = Image.open(normal_path)
 
         if game_screenshot is None:
-            full_screenshot = pyautogui.screenshot()
-            game_screenshot = full_screenshot.crop(game_area)
+            game_screenshot = frame_bus.grab(bbox=game_area).image
         
         scale = min(canvas_width / game_screenshot.width, canvas_height / game_screenshot.height)
         scaled_w, scaled_h = int(game_screenshot.width * scale), int(game_screenshot.height * scale)
@@ -564,37 +566,21 @@ class GuiApp(tk.Tk):
             info_text += f"  |  PA: {pa}  |  PM: {pm}"
         self.info_label.config(text=info_text)
 
-        self.update_map_button_text()
-        map_data = {}
+        self.update_map_button_text(coords)
+        # Une seule lecture des coordonnées et des données de carte (partagées, lecture seule) par affichage
+        map_data = (world_graph.get_map(coords) if coords else None) or {}
         fishing_spots_coords = set()
         exit_spots_coords = set()
         
         if not self.in_combat_view:
-            coords = get_map_coordinates()
-            if coords:
-                try:
-                    map_data = load_map_data(coords)
-                    for cell_data in map_data.get("cells", []):
-                        grid_cell = grid_instance.get_cell_from_screen_coords(cell_data['x'], cell_data['y'])
-                        if grid_cell:
-                            fishing_spots_coords.add(grid_cell)
-
-                    for direction, pos_data in map_data.get("exits", {}).items():
-                        grid_cell = grid_instance.get_cell_from_screen_coords(pos_data['x'], pos_data['y'])
-                        if grid_cell:
-                            exit_spots_coords.add(grid_cell)
-
-                except FileNotFoundError:
-                    pass
+            if map_data:
+                spot_points = [(c['x'], c['y']) for c in map_data.get("cells", [])]
+                fishing_spots_coords.update(filter(None, grid_instance.get_cells_from_screen_coords(spot_points)))
+
+                exit_points = [(p['x'], p['y']) for p in map_data.get("exits", {}).values()]
+                exit_spots_coords.update(filter(None, grid_instance.get_cells_from_screen_coords(exit_points)))
         
-        coords = get_map_coordinates()
-        combat_overrides = {}
-        if coords:
-            try:
-                map_data_for_overrides = load_map_data(coords)
-                combat_overrides = map_data_for_overrides.get("combat_overrides", {})
-            except FileNotFoundError:
-                pass
+        combat_overrides = world_graph.get_overrides(coords) if coords else {}
 
         for cell_coord, screen_pos in grid_instance.cells.items():
             if game_area[0] <= screen_pos[0] < game_area[2] and game_area[1] <= screen_pos[1] < game_area[3]:
@@ -625,7 +611,7 @@ class GuiApp(tk.Tk):
                         fill_color = "darkred"
                         stipple_pattern = "gray50"
                 elif self.in_combat_view or self.show_combat_grid:
-                    override_state = combat_overrides.get(str(cell_coord))
+                    override_state = combat_overrides.get(cell_coord)
                     if override_state == "walkable":
                         fill_color = "green"
                         stipple_pattern = "gray50"
@@ -727,15 +713,10 @@ class GuiApp(tk.Tk):
     def add_resource_at_cell(self, grid_coord):
         map_coords = get_map_coordinates()
         if not map_coords: return
-        try:
-            map_data = load_map_data(map_coords)
-        except FileNotFoundError:
-            map_data = {"map": map_coords, "cells": [], "exits": {}}
         screen_pos = grid_instance.cells.get(grid_coord)
         if not screen_pos: return
-        map_data.setdefault("cells", []).append({"x": screen_pos[0], "y": screen_pos[1]})
-        with open(f"Maps/{map_coords}.json", "w") as f:
-            json.dump(map_data, f, indent=4)
+        map_store.add_cell(map_coords, screen_pos[0], screen_pos[1])
+        world_graph.refresh(map_coords)
         self.log_to_widget(f"[GUI] Point de ressource ajouté à la case {grid_coord} sur la carte {map_coords}.")
         self.draw_map()
 
@@ -744,11 +725,11 @@ class GuiApp(tk.Tk):
         if not map_coords: return
         try:
             map_data = load_map_data(map_coords)
-            cells_to_keep = [c for c in map_data.get("cells", []) if grid_instance.get_cell_from_screen_coords(c['x'], c['y']) != grid_coord]
-            if len(cells_to_keep) < len(map_data.get("cells", [])):
-                map_data["cells"] = cells_to_keep
-                with open(f"Maps/{map_coords}.json", "w") as f:
-                    json.dump(map_data, f, indent=4)
+            cells = map_data.get("cells", [])
+            cell_grid_positions = grid_instance.get_cells_from_screen_coords([(c['x'], c['y']) for c in cells])
+            points_to_remove = [(c['x'], c['y']) for c, pos in zip(cells, cell_grid_positions) if pos == grid_coord]
+            if points_to_remove and map_store.remove_cells(map_coords, points_to_remove):
+                world_graph.refresh(map_coords)
                 self.log_to_widget(f"[GUI] Point de ressource retiré de la case {grid_coord} sur la carte {map_coords}.")
                 self.draw_map()
         except FileNotFoundError:
@@ -757,22 +738,15 @@ class GuiApp(tk.Tk):
     def set_combat_override(self, grid_coord, state):
         map_coords = get_map_coordinates()
         if not map_coords: return
-        try:
-            map_data = load_map_data(map_coords)
-        except FileNotFoundError:
-            map_data = {"map": map_coords, "cells": [], "exits": {}}
-        
-        overrides = map_data.setdefault("combat_overrides", {})
+        overrides = world_graph.get_overrides(map_coords)
         if state is None:
-            if str(grid_coord) in overrides:
-                del overrides[str(grid_coord)]
+            if grid_coord in overrides:
                 self.log_to_widget(f"[Grille] Remplacement pour la case {grid_coord} retiré.")
         else:
-            overrides[str(grid_coord)] = state
             self.log_to_widget(f"[Grille] Case {grid_coord} forcée à l'état '{state}'.")
 
-        with open(f"Maps/{map_coords}.json", "w") as f:
-            json.dump(map_data, f, indent=4)
+        map_store.set_override(map_coords, grid_coord, state)
+        world_graph.refresh(map_coords)
         self.draw_map()
 
     def toggle_grid_view(self):
@@ -808,19 +782,16 @@ class GuiApp(tk.Tk):
             try:
                 map_data = load_map_data(coords)
                 if item_type == "cell":
-                    cells_to_keep = [c for c in map_data.get("cells", []) if grid_instance.get_cell_from_screen_coords(c['x'], c['y']) != item_data]
-                    map_data["cells"] = cells_to_keep
+                    cells = map_data.get("cells", [])
+                    cell_grid_positions = grid_instance.get_cells_from_screen_coords([(c['x'], c['y']) for c in cells])
+                    map_store.remove_cells(coords, [(c['x'], c['y']) for c, pos in zip(cells, cell_grid_positions) if pos == item_data])
                 elif item_type == "exit":
-                    exit_to_delete = None
-                    for direction, pos_data in map_data.get("exits", {}).items():
-                        if grid_instance.get_cell_from_screen_coords(pos_data['x'], pos_data['y']) == item_data:
-                            exit_to_delete = direction
-                            break
+                    exits = map_data.get("exits", {})
+                    exit_grid_positions = grid_instance.get_cells_from_screen_coords([(p['x'], p['y']) for p in exits.values()])
+                    exit_to_delete = next((direction for direction, pos in zip(exits, exit_grid_positions) if pos == item_data), None)
                     if exit_to_delete:
-                        del map_data["exits"][exit_to_delete]
-                
-                with open(f"Maps/{coords}.json", "w") as f:
-                    json.dump(map_data, f, indent=4)
+                        map_store.remove_exit(coords, exit_to_delete)
+                world_graph.refresh(coords)
                 
                 self.log_to_widget(f"[GUI] Point {item_data} supprimé de la carte {coords}.")
                 self.selected_map_item = None
@@ -924,12 +895,15 @@ class GuiApp(tk.Tk):
                 messagebox.showerror("Erreur", "Les PA et PM doivent être des nombres entiers.")
                 return
             
+            # Clés non affichées dans le tableau (ex. "damage") conservées depuis la configuration existante
+            previous_spells = {spell.get("name"): spell for spell in combat_config.get("SPELLS", [])}
             spells = []
             for item_id in self.spells_tree.get_children():
                 values = self.spells_tree.item(item_id, 'values')
                 is_movement = True if values[7] == "Oui" else False
                 requires_los = True if values[8] == "Oui" else False
                 spells.append({
+                    **previous_spells.get(values[0], {}),
                     "name": values[0], 
                     "key": values[1], 
                     "cost": int(values[2]), 
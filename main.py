@@ -1,14 +1,17 @@
 from fishing import run_fishing_cycle
 from utils import log, is_stop_requested, check_for_pause, get_map_coordinates, image_file_lock
 from fight import handle_fight, is_fight_started
+from capture import frame_bus
+from world import world_graph, tour_planner
+from map_store import map_store, neighbour_coords
 import pytesseract
 import os
 import json
+import copy
 import time
 import re
 import cv2
 import numpy as np
-from PIL import ImageGrab
 import pyautogui
 import threading
 from tkinter import messagebox
@@ -22,16 +25,10 @@ def prompt_yes_no(message):
 
 def load_cells(map_coords):
     # --- Gestion des fichiers de carte ---
-    path = os.path.join(MAP_FOLDER, f"{map_coords}.json")
-    try:
-        if not os.path.exists(path):
-            return None
-        with open(path, "r") as f:
-            data = json.load(f)
-    except Exception as e:
-        log(f"Erreur lors du chargement du fichier de map : {e}")
+    data = world_graph.get_map(map_coords)
+    if data is None:
         return None
-    return data["cells"]
+    return copy.deepcopy(data.get("cells", []))
 
 def create_map_interactively(map_coords, config, is_editing=False):
     # --- Outil de création de carte interactif ---
@@ -94,7 +91,7 @@ def create_map_interactively(map_coords, config, is_editing=False):
                 log("Capture du fond de la carte...")
                 game_area = (0, 24, 1348, 808)
                 image_dir = os.path.join(MAP_FOLDER, "Images")
-                screenshot = ImageGrab.grab(bbox=game_area)
+                screenshot = frame_bus.grab(bbox=game_area, max_age=0).image
                 bg_path = os.path.join(image_dir, f"{map_coords}Normal.png")
                 with image_file_lock:
                     os.makedirs(image_dir, exist_ok=True)
@@ -111,32 +108,20 @@ def create_map_interactively(map_coords, config, is_editing=False):
         pass
 
     map_data = {"map": map_coords, "cells": cells, "exits": exits}
-    os.makedirs(MAP_FOLDER, exist_ok=True)
-    with open(os.path.join(MAP_FOLDER, f"{map_coords}.json"), "w") as f:
-        json.dump(map_data, f, indent=4)
+    map_store.save_map(map_data)
+    world_graph.refresh(map_coords)
     log(f"Map {map_coords} sauvegardée avec {len(cells)} cases de pêche et {len(exits)} sorties.")
     return cells
 
 def load_map_data(map_coords):
-    with open(os.path.join(MAP_FOLDER, f"{map_coords}.json"), "r") as f:
-        return json.load(f)
+    # Copie des données du graphe : l'appelant peut la modifier sans toucher au graphe partagé
+    data = world_graph.get_map(map_coords)
+    if data is None:
+        raise FileNotFoundError(os.path.join(MAP_FOLDER, f"{map_coords}.json"))
+    return copy.deepcopy(data)
 
 def get_next_map_coords(current_coords_str, direction):
-    x, y = map(int, current_coords_str.split(','))
-    
-    moves = {
-        "haut": (x, y - 1),
-        "bas": (x, y + 1),
-        "gauche": (x - 1, y),
-        "droite": (x + 1, y),
-        "haut-gauche": (x - 1, y - 1),
-        "haut-droite": (x + 1, y - 1),
-        "bas-gauche": (x - 1, y + 1),
-        "bas-droite": (x + 1, y + 1),
-    }
-    
-    next_x, next_y = moves.get(direction, (x, y))
-    return f"{next_x},{next_y}"
+    return neighbour_coords(current_coords_str, direction)
 
 def find_exit_with_fallback(map_data, primary_direction):
     exits = map_data.get("exits", {})
@@ -185,8 +170,7 @@ def main_bot_logic(gui_app, finish_cb):
     with open("config.json", "r") as f:
         config = json.load(f)
 
-    visited_maps = set()
-    previous_coords = None
+    world_graph.start_watching()
 
     try:
         if gui_app.auto_combat_var.get():
@@ -251,29 +235,7 @@ def main_bot_logic(gui_app, finish_cb):
                     log(f"Le bot ne peut pas continuer sur la map {coords} sans données. Arrêt.")
                     break
 
-            target_direction = None
-            visited_maps.add(coords)
-            
-            unvisited_options = []
-            visited_options = []
-            previous_map_option = None
-
-            for direction, exit_pos in map_data.get("exits", {}).items():
-                next_coords = get_next_map_coords(coords, direction)
-                if os.path.exists(os.path.join(MAP_FOLDER, f"{next_coords}.json")):
-                    if next_coords == previous_coords:
-                        previous_map_option = direction
-                    elif next_coords not in visited_maps:
-                        unvisited_options.append(direction)
-                    else:
-                        visited_options.append(direction)
-            
-            if unvisited_options:
-                target_direction = unvisited_options[0]
-            elif visited_options:
-                target_direction = visited_options[0]
-            elif previous_map_option:
-                target_direction = previous_map_option
+            target_direction = tour_planner.next_direction(coords)
 
             log(f"{len(map_data.get('cells', []))} cases pêchables sur la map {coords}.")
             
@@ -294,9 +256,8 @@ def main_bot_logic(gui_app, finish_cb):
             if is_stop_requested():
                 break
 
-            previous_coords = coords
-
     finally:
+        map_store.export_dirty()
         finish_cb()
 
 if __name__ == "__main__":
@@ -0,0 +1,261 @@
+import os
+import json
+import atexit
+import sqlite3
+import threading
+from utils import log
+
+# --- Constantes ---
+MAP_FOLDER = "Maps"
+MAP_DB_PATH = os.path.join(MAP_FOLDER, "maps.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS maps (
+    coords TEXT PRIMARY KEY,
+    json_mtime REAL,
+    dirty INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS cells (
+    map TEXT NOT NULL REFERENCES maps(coords) ON DELETE CASCADE,
+    idx INTEGER NOT NULL,
+    x INTEGER NOT NULL,
+    y INTEGER NOT NULL,
+    PRIMARY KEY (map, idx)
+);
+CREATE TABLE IF NOT EXISTS exits (
+    map TEXT NOT NULL REFERENCES maps(coords) ON DELETE CASCADE,
+    direction TEXT NOT NULL,
+    x INTEGER NOT NULL,
+    y INTEGER NOT NULL,
+    target TEXT,
+    PRIMARY KEY (map, direction)
+);
+CREATE INDEX IF NOT EXISTS exits_by_target ON exits(target);
+CREATE TABLE IF NOT EXISTS overrides (
+    map TEXT NOT NULL REFERENCES maps(coords) ON DELETE CASCADE,
+    q INTEGER NOT NULL,
+    r INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    PRIMARY KEY (map, q, r)
+);
+"""
+
+DIRECTION_OFFSETS = {
+    "haut": (0, -1),
+    "bas": (0, 1),
+    "gauche": (-1, 0),
+    "droite": (1, 0),
+    "haut-gauche": (-1, -1),
+    "haut-droite": (1, -1),
+    "bas-gauche": (-1, 1),
+    "bas-droite": (1, 1),
+}
+
+def parse_coords(coords):
+    x, y = coords.split(',')
+    return int(x), int(y)
+
+def neighbour_coords(coords, direction):
+    x, y = parse_coords(coords)
+    dx, dy = DIRECTION_OFFSETS.get(direction, (0, 0))
+    return f"{x + dx},{y + dy}"
+
+def parse_override_cell(cell_str):
+    return tuple(map(int, cell_str.strip('()').split(',')))
+
+class MapStore:
+    # --- Données des cartes dans une base SQLite indexée ; les fichiers Maps/*.json restent le format d'échange ---
+    # Les modifications ne touchent que la base ; les cartes modifiées sont réécrites en JSON à la fermeture (export_dirty)
+    def __init__(self, db_path=MAP_DB_PATH, folder=MAP_FOLDER):
+        self.db_path = db_path
+        self.folder = folder
+        self._conn = None
+        self._lock = threading.RLock()
+        self._ignored_files = set()  # (coordonnées, date) des fichiers déjà signalés comme ignorés
+
+    def _connection(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA foreign_keys = ON")
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self.export_dirty()
+                self._conn.close()
+                self._conn = None
+
+    # --- Écriture (une transaction par modification) ---
+    def _write_map(self, conn, map_data, json_mtime=None, dirty=True):
+        coords = map_data["map"]
+        conn.execute("INSERT INTO maps (coords, json_mtime, dirty) VALUES (?, ?, ?) "
+                     "ON CONFLICT(coords) DO UPDATE SET json_mtime = COALESCE(excluded.json_mtime, json_mtime), dirty = excluded.dirty",
+                     (coords, json_mtime, int(dirty)))
+        for table in ("cells", "exits", "overrides"):
+            conn.execute(f"DELETE FROM {table} WHERE map = ?", (coords,))
+        conn.executemany("INSERT INTO cells (map, idx, x, y) VALUES (?, ?, ?, ?)",
+                         [(coords, i, cell["x"], cell["y"]) for i, cell in enumerate(map_data.get("cells", []))])
+        conn.executemany("INSERT INTO exits (map, direction, x, y, target) VALUES (?, ?, ?, ?, ?)",
+                         [(coords, direction, pos["x"], pos["y"], neighbour_coords(coords, direction))
+                          for direction, pos in map_data.get("exits", {}).items()])
+        conn.executemany("INSERT INTO overrides (map, q, r, state) VALUES (?, ?, ?, ?)",
+                         [(coords, *parse_override_cell(cell), state) for cell, state in map_data.get("combat_overrides", {}).items()])
+
+    def save_map(self, map_data):
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                self._write_map(conn, map_data)
+
+    def add_cell(self, coords, x, y):
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute("INSERT OR IGNORE INTO maps (coords, dirty) VALUES (?, 1)", (coords,))
+                conn.execute("INSERT INTO cells (map, idx, x, y) SELECT ?, COALESCE(MAX(idx) + 1, 0), ?, ? FROM cells WHERE map = ?",
+                             (coords, x, y, coords))
+                conn.execute("UPDATE maps SET dirty = 1 WHERE coords = ?", (coords,))
+
+    def remove_cells(self, coords, points):
+        # points : positions écran (x, y) des points à retirer ; renvoie le nombre de points supprimés
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                removed = sum(conn.execute("DELETE FROM cells WHERE map = ? AND x = ? AND y = ?", (coords, x, y)).rowcount
+                              for x, y in points)
+                if removed:
+                    conn.execute("UPDATE maps SET dirty = 1 WHERE coords = ?", (coords,))
+        return removed
+
+    def remove_exit(self, coords, direction):
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                if conn.execute("DELETE FROM exits WHERE map = ? AND direction = ?", (coords, direction)).rowcount:
+                    conn.execute("UPDATE maps SET dirty = 1 WHERE coords = ?", (coords,))
+
+    def set_override(self, coords, cell, state):
+        # state None : retrait du remplacement
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute("INSERT OR IGNORE INTO maps (coords, dirty) VALUES (?, 1)", (coords,))
+                if state is None:
+                    conn.execute("DELETE FROM overrides WHERE map = ? AND q = ? AND r = ?", (coords, *cell))
+                else:
+                    conn.execute("INSERT OR REPLACE INTO overrides (map, q, r, state) VALUES (?, ?, ?, ?)", (coords, *cell, state))
+                conn.execute("UPDATE maps SET dirty = 1 WHERE coords = ?", (coords,))
+
+    def delete_map(self, coords):
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute("DELETE FROM maps WHERE coords = ?", (coords,))
+
+    # --- Lecture ---
+    def get_map(self, coords):
+        with self._lock:
+            conn = self._connection()
+            if conn.execute("SELECT 1 FROM maps WHERE coords = ?", (coords,)).fetchone() is None:
+                return None
+            map_data = {
+                "map": coords,
+                "cells": [{"x": x, "y": y} for x, y in conn.execute("SELECT x, y FROM cells WHERE map = ? ORDER BY idx", (coords,))],
+                "exits": {direction: {"x": x, "y": y} for direction, x, y in conn.execute(
+                    "SELECT direction, x, y FROM exits WHERE map = ? ORDER BY rowid", (coords,))},
+            }
+            overrides = {str((q, r)): state for q, r, state in conn.execute(
+                "SELECT q, r, state FROM overrides WHERE map = ? ORDER BY rowid", (coords,))}
+            if overrides:
+                map_data["combat_overrides"] = overrides
+            return map_data
+
+    def json_mtime(self, coords):
+        # Date du fichier JSON au dernier import ou export ; None si la carte n'existe que dans la base
+        with self._lock:
+            row = self._connection().execute("SELECT json_mtime FROM maps WHERE coords = ?", (coords,)).fetchone()
+            return row[0] if row else None
+
+    def map_coords(self):
+        with self._lock:
+            return [coords for coords, in self._connection().execute("SELECT coords FROM maps")]
+
+    def maps_with_exits_to(self, target):
+        with self._lock:
+            return {coords: direction for coords, direction in self._connection().execute(
+                "SELECT map, direction FROM exits WHERE target = ?", (target,))}
+
+    def spot_counts(self):
+        with self._lock:
+            return dict(self._connection().execute(
+                "SELECT maps.coords, COUNT(cells.idx) FROM maps LEFT JOIN cells ON cells.map = maps.coords GROUP BY maps.coords"))
+
+    # --- Import / export du format JSON ---
+    def import_json(self):
+        # Importe les fichiers plus récents que la base ; renvoie les coordonnées importées ou supprimées
+        changed = set()
+        try:
+            files = {entry.name[:-5]: entry.path for entry in os.scandir(self.folder)
+                     if entry.is_file() and entry.name.endswith(".json")}
+        except FileNotFoundError:
+            files = {}
+        with self._lock:
+            conn = self._connection()
+            known = {coords: (mtime, dirty) for coords, mtime, dirty in conn.execute("SELECT coords, json_mtime, dirty FROM maps")}
+            loaded = []
+            for coords, path in files.items():
+                try:
+                    mtime = os.path.getmtime(path)
+                    # Carte créée depuis l'interface et jamais exportée (json_mtime vide) : la base fait foi
+                    if coords in known and (known[coords][0] is None or mtime <= known[coords][0]):
+                        continue
+                    # Modifications de la base pas encore exportées : le fichier n'écrase rien, il sera réécrit à l'export
+                    if coords in known and known[coords][1]:
+                        if (coords, mtime) not in self._ignored_files:
+                            self._ignored_files.add((coords, mtime))
+                            log(f"[Cartes] {path} modifié alors que la carte {coords} a des modifications non exportées : fichier ignoré.")
+                        continue
+                    with open(path, "r") as f:
+                        map_data = json.load(f)
+                except (OSError, json.JSONDecodeError) as e:
+                    log(f"[Cartes] Lecture impossible de {path} : {e}")
+                    continue
+                map_data["map"] = coords
+                loaded.append((map_data, mtime))
+            # Fichier supprimé : la carte disparaît, sauf si elle contient des modifications jamais exportées
+            removed = [coords for coords, (mtime, dirty) in known.items() if coords not in files and mtime is not None and not dirty]
+            # Une seule transaction pour tout l'import
+            with conn:
+                for map_data, mtime in loaded:
+                    self._write_map(conn, map_data, json_mtime=mtime, dirty=False)
+                conn.executemany("DELETE FROM maps WHERE coords = ?", [(coords,) for coords in removed])
+            changed.update(map_data["map"] for map_data, _ in loaded)
+            changed.update(removed)
+        return changed
+
+    def export_map(self, coords):
+        with self._lock:
+            map_data = self.get_map(coords)
+            if map_data is None:
+                return
+            path = os.path.join(self.folder, f"{coords}.json")
+            os.makedirs(self.folder, exist_ok=True)
+            with open(path, "w") as f:
+                json.dump(map_data, f, indent=4)
+            conn = self._connection()
+            with conn:
+                conn.execute("UPDATE maps SET json_mtime = ?, dirty = 0 WHERE coords = ?", (os.path.getmtime(path), coords))
+
+    def export_dirty(self):
+        with self._lock:
+            dirty = [coords for coords, in self._connection().execute("SELECT coords FROM maps WHERE dirty = 1")]
+            for coords in dirty:
+                self.export_map(coords)
+            if dirty:
+                log(f"[Cartes] {len(dirty)} carte(s) exportée(s) vers {self.folder}.")
+
+map_store = MapStore()
+atexit.register(map_store.close)
@@ -0,0 +1,254 @@
+import os
+import json
+import threading
+import numpy as np
+import cv2
+
+# --- Constantes ---
+IMAGE_FOLDER = "Images"
+COORDINATE_GLYPHS_PATH = os.path.join(IMAGE_FOLDER, "glyphs_coordinates.npz")
+HUD_GLYPHS_PATH = os.path.join(IMAGE_FOLDER, "glyphs_hud.npz")
+GLYPH_WIDTH = 12
+GLYPH_HEIGHT = 16
+GLYPH_MAX_DISTANCE = 0.18  # Écart moyen maximal (0..1) avec le modèle le plus proche
+GLYPH_WIDTH_TOLERANCE = 2  # Écart de largeur (px) toléré avec le modèle
+GLYPH_MAX_SAMPLES = 5  # Exemples conservés par caractère
+OCR_BATCH_PADDING = 10  # Marge blanche (px) autour de chaque zone dans une requête groupée
+SINGLE_LINE_PSMS = (7, 8, 10, 13)  # Modes tesseract limités à une ligne, un mot ou un caractère
+GLYPH_SPACE_RATIO = 0.35  # Espace inséré quand l'écart entre colonnes dépasse cette fraction de la hauteur de ligne
+UNKNOWN_GLYPH = "?"
+DIGIT_CHARS = "0123456789"
+COORDINATE_CHARS = DIGIT_CHARS + ",-"
+
+def segment_glyphs(binary):
+    # Découpe l'image seuillée (texte blanc) en colonnes de pixels allumés ; renvoie (début, fin) et la ligne de texte
+    lit = binary > 0
+    rows = np.flatnonzero(lit.any(axis=1))
+    if len(rows) == 0:
+        return [], None
+    columns = np.concatenate(([False], lit.any(axis=0), [False]))
+    edges = np.flatnonzero(np.diff(columns.astype(np.int8)))
+    return list(zip(edges[::2], edges[1::2])), (rows[0], rows[-1] + 1)
+
+def group_words(spans, line):
+    # Regroupe les glyphes en mots : un écart supérieur à GLYPH_SPACE_RATIO de la hauteur de ligne est un espace
+    if not spans:
+        return []
+    space_gap = max(2, GLYPH_SPACE_RATIO * (line[1] - line[0]))
+    words = [[spans[0]]]
+    for previous, span in zip(spans, spans[1:]):
+        if span[0] - previous[1] >= space_gap:
+            words.append([])
+        words[-1].append(span)
+    return words
+
+def _normalize(binary, span, line):
+    # La glyphe garde sa position verticale dans la ligne : virgule, tiret et chiffres restent distincts
+    glyph = (binary[line[0]:line[1], span[0]:span[1]] > 0).astype(np.float32)
+    return cv2.resize(glyph, (GLYPH_WIDTH, GLYPH_HEIGHT), interpolation=cv2.INTER_AREA)
+
+class GlyphClassifier:
+    # --- Reconnaissance de caractères par comparaison à des modèles appris sur des lectures Tesseract confirmées ---
+    def __init__(self, bundle_path):
+        self.bundle_path = bundle_path
+        self.samples = {}  # caractère -> liste de (bitmap normalisé, largeur en px)
+        self.is_loaded = False
+        self._lock = threading.Lock()
+        self._stack = None
+
+    def load(self):
+        with self._lock:
+            self.samples = {}
+            if os.path.exists(self.bundle_path):
+                try:
+                    with np.load(self.bundle_path, allow_pickle=False) as bundle:
+                        chars = json.loads(str(bundle["chars"]))
+                        for char, bitmap, width in zip(chars, bundle["bitmaps"], bundle["widths"]):
+                            self.samples.setdefault(char, []).append((bitmap.astype(np.float32), int(width)))
+                except Exception:
+                    self.samples = {}
+            self._stack = None
+            self.is_loaded = True
+
+    def save(self):
+        chars, bitmaps, widths = [], [], []
+        for char, samples in self.samples.items():
+            for bitmap, width in samples:
+                chars.append(char)
+                bitmaps.append(bitmap)
+                widths.append(width)
+        try:
+            np.savez(self.bundle_path, chars=np.array(json.dumps(chars)),
+                     bitmaps=np.array(bitmaps, dtype=np.float32).reshape(-1, GLYPH_HEIGHT, GLYPH_WIDTH),
+                     widths=np.array(widths, dtype=np.int32))
+        except OSError:
+            pass
+
+    def knows(self, chars):
+        if not self.is_loaded:
+            self.load()
+        return all(char in self.samples for char in chars)
+
+    def _templates(self):
+        # Tous les exemples empilés pour une comparaison vectorisée
+        if self._stack is None:
+            chars = [char for char, samples in self.samples.items() for _ in samples]
+            bitmaps = [bitmap for samples in self.samples.values() for bitmap, _ in samples]
+            widths = [width for samples in self.samples.values() for _, width in samples]
+            self._stack = (chars, np.array(bitmaps, dtype=np.float32).reshape(-1, GLYPH_HEIGHT, GLYPH_WIDTH), np.array(widths))
+        return self._stack
+
+    def classify(self, binary):
+        # Texte reconnu, espaces compris ; UNKNOWN_GLYPH pour chaque glyphe sans modèle assez proche
+        if not self.is_loaded:
+            self.load()
+        spans, line = segment_glyphs(binary)
+        words = group_words(spans, line)
+        chars, bitmaps, widths = self._templates()
+        text = []
+        for word in words:
+            for span in word:
+                if not chars:
+                    text.append(UNKNOWN_GLYPH)
+                    continue
+                glyph = _normalize(binary, span, line)
+                distances = np.abs(bitmaps - glyph).mean(axis=(1, 2))
+                distances[np.abs(widths - (span[1] - span[0])) > GLYPH_WIDTH_TOLERANCE] = np.inf
+                best = int(np.argmin(distances))
+                text.append(chars[best] if distances[best] <= GLYPH_MAX_DISTANCE else UNKNOWN_GLYPH)
+            text.append(" ")
+        return "".join(text).strip()
+
+    def learn(self, binary, text):
+        # Alignement mot par mot : seuls les mots dont chaque glyphe correspond à un caractère lu sont appris
+        if not self.is_loaded:
+            self.load()
+        spans, line = segment_glyphs(binary)
+        words = group_words(spans, line)
+        text_words = text.split()
+        if not words or len(words) != len(text_words):
+            return False
+        pairs = [pair for word, text_word in zip(words, text_words) if len(word) == len(text_word) for pair in zip(text_word, word)]
+
+        changed = False
+        with self._lock:
+            for char, span in pairs:
+                samples = self.samples.setdefault(char, [])
+                if len(samples) >= GLYPH_MAX_SAMPLES:
+                    continue
+                glyph = _normalize(binary, span, line)
+                width = int(span[1] - span[0])
+                # Un exemple quasi identique à un exemple existant n'apporte rien
+                if any(abs(w - width) <= 1 and np.abs(b - glyph).mean() < GLYPH_MAX_DISTANCE / 3 for b, w in samples):
+                    continue
+                samples.append((glyph, width))
+                changed = True
+            if changed:
+                self._stack = None
+                self.save()
+        return changed
+
+coordinate_glyphs = GlyphClassifier(COORDINATE_GLYPHS_PATH)
+hud_digit_glyphs = GlyphClassifier(HUD_GLYPHS_PATH)
+
+class OcrService:
+    # --- Moteur OCR unique pour la session : API tesserocr persistante si installée, sinon une requête pytesseract par lot ---
+    def __init__(self):
+        self.backend = None
+        self._api = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        try:
+            import tesserocr
+            import pytesseract
+            tessdata = os.path.join(os.path.dirname(pytesseract.pytesseract.tesseract_cmd), "tessdata")
+            self._api = tesserocr.PyTessBaseAPI(path=tessdata) if os.path.isdir(tessdata) else tesserocr.PyTessBaseAPI()
+            self.backend = "tesserocr"
+        except (ImportError, RuntimeError):
+            self._api = None
+            self.backend = "pytesseract"
+
+    def close(self):
+        with self._lock:
+            if self._api is not None:
+                self._api.End()
+            self._api = None
+            self.backend = None
+
+    def read(self, image, whitelist=None, psm=7):
+        return self.read_batch([(image, whitelist)], psm)[0]
+
+    def read_batch(self, requests, psm=7):
+        # requests : liste de (image seuillée, texte sombre sur fond clair ; liste blanche ou None), textes rendus dans le même ordre
+        if not requests:
+            return []
+        with self._lock:
+            if self.backend is None:
+                self._start()
+            try:
+                if self._api is not None:
+                    return [self._read_tesserocr(image, whitelist, psm) for image, whitelist in requests]
+                # Une seule liste blanche par appel tesseract : un lot assemblé par liste blanche
+                groups = {}
+                for i, (_, whitelist) in enumerate(requests):
+                    groups.setdefault(whitelist, []).append(i)
+                results = [""] * len(requests)
+                for whitelist, indices in groups.items():
+                    texts = self._read_stitched([requests[i][0] for i in indices], whitelist, psm)
+                    for i, text in zip(indices, texts):
+                        results[i] = text
+                return results
+            except Exception as e:
+                from utils import log  # utils importe ce module
+                log(f"[OCR] Échec de la lecture ({self.backend}) : {type(e).__name__}: {e}")
+                return [""] * len(requests)
+
+    def _read_tesserocr(self, image, whitelist, psm):
+        from PIL import Image
+        self._api.SetPageSegMode(psm)
+        self._api.SetVariable("tessedit_char_whitelist", whitelist or "")
+        self._api.SetImage(Image.fromarray(image))
+        return self._api.GetUTF8Text().strip()
+
+    def _read_stitched(self, images, whitelist, psm):
+        # Zones empilées verticalement dans une seule image : un seul processus tesseract pour le lot
+        import pytesseract
+        pad = OCR_BATCH_PADDING
+        width = max(image.shape[1] for image in images) + 2 * pad
+        height = sum(image.shape[0] + pad for image in images) + pad
+        canvas = np.full((height, width), 255, dtype=np.uint8)
+        bands, top = [], pad
+        for image in images:
+            canvas[top:top + image.shape[0], pad:pad + image.shape[1]] = image
+            bands.append((top - pad // 2, top + image.shape[0] + pad // 2))
+            top += image.shape[0] + pad
+
+        # Plusieurs zones empilées forment un bloc : les modes « une seule ligne / un seul mot » deviennent --psm 6
+        if len(images) > 1 and psm in SINGLE_LINE_PSMS:
+            psm = 6
+        config = f'--psm {psm}'
+        if whitelist:
+            config += f' -c tessedit_char_whitelist={whitelist}'
+        data = pytesseract.image_to_data(canvas, config=config, output_type=pytesseract.Output.DICT)
+
+        # Chaque mot revient à la zone qui contient son centre vertical
+        words = [[] for _ in images]
+        for text, left, word_top, word_height in zip(data["text"], data["left"], data["top"], data["height"]):
+            if not text.strip():
+                continue
+            center = word_top + word_height / 2
+            for i, (band_top, band_bottom) in enumerate(bands):
+                if band_top <= center < band_bottom:
+                    words[i].append((left, text.strip()))
+                    break
+
+        results = []
+        for band_words in words:
+            text = " ".join(word for _, word in sorted(band_words))
+            if whitelist:
+                text = "".join(char for char in text if char in whitelist or char == " ").strip()
+            results.append(text)
+        return results
+
+ocr_service = OcrService()
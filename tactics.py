@@ -0,0 +1,250 @@
+import time
+import numpy as np
+from utils import log
+from grid import grid_instance, ReachabilityField
+
+# --- Choix de la position d'attaque ---
+# Dégâts d'un sort : clé "damage" de la configuration si présente, sinon son coût en PA
+
+def spell_damage(spell):
+    return spell.get('damage', spell['cost'])
+
+def max_casts(spell):
+    # Un sort avec temps de recharge ne peut être lancé qu'une fois par tour
+    return 1 if spell.get('cooldown', 0) > 0 else spell.get('casts_per_turn', 99)
+
+def casts_left(spell, spell_casts):
+    return max_casts(spell) - spell_casts.get(spell['name'], 0)
+
+def best_spell_sequence(spells, pa, spell_casts):
+    # Sac à dos borné sur les PA : (dégâts, PA dépensés, sorts lancés) maximisant les dégâts, puis économisant les PA
+    best = {0: (0, ())}
+    for spell in spells:
+        cost = spell['cost']
+        if cost <= 0:
+            continue
+        for _ in range(min(casts_left(spell, spell_casts), pa // cost)):
+            extended = dict(best)
+            for spent, (damage, sequence) in best.items():
+                total = spent + cost
+                if total <= pa and damage + spell_damage(spell) > extended.get(total, (-1,))[0]:
+                    extended[total] = (damage + spell_damage(spell), sequence + (spell,))
+            best = extended
+    spent, (damage, sequence) = max(best.items(), key=lambda item: (item[1][0], -item[0]))
+    return damage, spent, sequence
+
+def find_attack_position(player_pos, monster_positions, spells, current_pa, current_pm, spell_casts, grid=grid_instance):
+    # Pour chaque monstre : cases atteignables avec les PM restants d'où au moins un sort le touche (portée min/max, LdV).
+    # Renvoie l'option qui maximise les dégâts par PA dépensé, puis les dégâts, puis la moins coûteuse en PM ; None si aucune
+    attack_spells = [s for s in spells if not s.get('is_movement') and s['cost'] <= current_pa and casts_left(s, spell_casts) > 0]
+    if not attack_spells or not monster_positions:
+        return None
+
+    field = grid.reachability(player_pos)
+    reachable = field.cells_within(current_pm) if field is not None else [(player_pos, 0)]
+    occupied = set(monster_positions)
+    reachable = [(cell, cost) for cell, cost in reachable if cell not in occupied or cell == player_pos]
+    candidates, move_costs = [cell for cell, _ in reachable], [cost for _, cost in reachable]
+    ids = [grid.cell_ids.get(cell) for cell in candidates]
+    candidate_ids = np.array(ids, dtype=np.int64) if None not in ids else None
+
+    sequences = {}  # sorts utilisables -> meilleure séquence, partagée entre cases et monstres
+    best, best_key = None, None
+    needs_los = any(s.get('requires_los', True) for s in attack_spells)
+    for target in monster_positions:
+        # Distances lues dans la table de la grille ; calcul case par case si une case est hors de la zone visible
+        target_id = grid.cell_ids.get(target)
+        if target_id is not None and candidate_ids is not None:
+            distances = grid.distance_table[target_id, candidate_ids].tolist()
+        else:
+            distances = [grid.get_distance(cell, target) for cell in candidates]
+        sight = grid.lines_of_sight(candidates, target) if needs_los else [True] * len(candidates)
+        for cell, move_cost, distance, has_los in zip(candidates, move_costs, distances, sight):
+            usable = tuple(s['name'] for s in attack_spells
+                           if s.get('range_min', 1) <= distance <= s.get('range_max', 0) and (has_los or not s.get('requires_los', True)))
+            if not usable:
+                continue
+            if usable not in sequences:
+                sequences[usable] = best_spell_sequence([s for s in attack_spells if s['name'] in usable], current_pa, spell_casts)
+            damage, spent, sequence = sequences[usable]
+            if not sequence:
+                continue
+            damage_per_pa = damage / spent if spent else 0
+            key = (damage_per_pa, damage, -move_cost, -spent, -distance)
+            if best_key is None or key > best_key:
+                # Premier sort lancé : le plus prioritaire de la séquence (ordre de SPELLS)
+                first = min(sequence, key=attack_spells.index)
+                best_key = key
+                best = {"cell": cell, "target": target, "spell": first, "sequence": sequence, "move_cost": move_cost,
+                        "damage": damage, "pa_spent": spent, "damage_per_pa": damage_per_pa}
+    return best
+
+# --- Planification du tour ---
+TURN_PLAN_BUDGET = 0.25  # Temps maximal (s) de recherche du plan de tour
+PLAN_CANDIDATE_CELLS = 6  # Destinations (déplacement ou téléportation) explorées depuis chaque état
+
+def is_spell_ready(spell, spell_cooldowns, current_turn):
+    last_used = spell_cooldowns.get(spell['name'], -999)
+    return current_turn >= last_used + spell.get('cooldown', 0)
+
+class TurnPlanner:
+    # --- Recherche en profondeur des suites déplacement / téléportation / sorts, états mémoïsés, sous budget de temps ---
+    # Un état : (case, PA, PM, lancers par sort, premier sort autorisé, déplacement interdit). Les dégâts ne dépendent
+    # pas de la cible : à case égale, les sorts sont essayés dans l'ordre de SPELLS pour ne pas explorer les permutations.
+    def __init__(self, player_pos, monster_positions, spells, spell_casts, spell_cooldowns, current_turn, grid=grid_instance, budget=TURN_PLAN_BUDGET):
+        self.grid = grid
+        self.monsters = list(monster_positions)
+        self.occupied = set(self.monsters)
+        self.spells = [s for s in spells if s['cost'] > 0 and is_spell_ready(s, spell_cooldowns, current_turn)]
+        self.start = player_pos
+        self.start_casts = tuple(spell_casts.get(s['name'], 0) for s in self.spells)
+        self.budget = budget
+        self.deadline = None
+        self.is_complete = True
+        self.damage = 0
+        self._fields = {}  # case -> champ d'accessibilité
+        self._usable = {}  # case -> {indice de sort d'attaque: cible}
+        self._potentials = {}  # (sorts utilisables, PA, lancers) -> dégâts
+        self._memo = {}
+
+    # --- Géométrie, mémoïsée par case ---
+    def _field(self, cell):
+        if cell not in self._fields:
+            cell_id = self.grid.cell_ids.get(cell)
+            usable = cell_id is not None and self.grid.walkable_cells.mask[cell_id]
+            self._fields[cell] = ReachabilityField(self.grid, cell_id) if usable else None
+        return self._fields[cell]
+
+    def _usable_spells(self, cell):
+        # Sorts d'attaque qui touchent au moins un monstre depuis la case, avec la cible la plus proche
+        if cell not in self._usable:
+            usable = {}
+            for target in sorted(self.monsters, key=lambda m: self.grid.get_distance(cell, m)):
+                distance = self.grid.get_distance(cell, target)
+                has_los = None
+                for index, spell in enumerate(self.spells):
+                    if spell.get('is_movement') or index in usable:
+                        continue
+                    if not spell.get('range_min', 1) <= distance <= spell.get('range_max', 0):
+                        continue
+                    if spell.get('requires_los', True):
+                        if has_los is None:
+                            has_los = self.grid.lines_of_sight([cell], target)[0]
+                        if not has_los:
+                            continue
+                    usable[index] = target
+            self._usable[cell] = usable
+        return self._usable[cell]
+
+    def _potential(self, cell, pa, casts):
+        # Dégâts maximaux en restant sur la case : classe les destinations avant de les explorer
+        usable = tuple(sorted(self._usable_spells(cell)))
+        key = (usable, pa, tuple(casts[i] for i in usable))
+        if key not in self._potentials:
+            spells = [self.spells[i] for i in usable]
+            self._potentials[key] = best_spell_sequence(spells, pa, {self.spells[i]['name']: casts[i] for i in usable})[0]
+        return self._potentials[key]
+
+    def _ranked(self, destinations, pa, casts):
+        # destinations : (case, coût) ; seules les cases d'où une attaque est possible, les plus rentables d'abord
+        scored = [(self._potential(cell, pa, casts), -cost, cell, cost) for cell, cost in destinations]
+        scored = [item for item in scored if item[0] > 0]
+        scored.sort(key=lambda item: (-item[0], -item[1]))
+        return [(cell, cost) for _, _, cell, cost in scored[:PLAN_CANDIDATE_CELLS]]
+
+    def _teleport_destinations(self, cell, spell):
+        walkable = self.grid.walkable_cells
+        destinations = []
+        for candidate in self.grid.cells:
+            if candidate in self.occupied or candidate not in walkable:
+                continue
+            if not spell.get('range_min', 1) <= self.grid.get_distance(cell, candidate) <= spell.get('range_max', 0):
+                continue
+            if spell.get('requires_los', True) and not self.grid.lines_of_sight([cell], candidate)[0]:
+                continue
+            destinations.append((candidate, 0))
+        return destinations
+
+    # --- Recherche ---
+    def _search(self, cell, pa, pm, casts, first_spell, just_moved):
+        # Meilleure suite depuis l'état : (dégâts, -PM dépensés, -PA dépensés, actions), comparée sur les trois premiers termes
+        key = (cell, pa, pm, casts, first_spell, just_moved)
+        if key in self._memo:
+            return self._memo[key]
+        best = (0, 0, 0, ())
+        if time.perf_counter() > self.deadline:
+            self.is_complete = False
+            return best
+
+        # Sorts d'attaque depuis la case courante
+        for index, target in self._usable_spells(cell).items():
+            spell = self.spells[index]
+            if index < first_spell or spell['cost'] > pa or casts[index] >= max_casts(spell):
+                continue
+            next_casts = casts[:index] + (casts[index] + 1,) + casts[index + 1:]
+            damage, pm_saved, pa_saved, actions = self._search(cell, pa - spell['cost'], pm, next_casts, index, False)
+            best = max(best, (damage + spell_damage(spell), pm_saved, pa_saved - spell['cost'], (("cast", index, target),) + actions),
+                       key=lambda option: option[:3])
+
+        # Déplacement avec les PM (pas deux déplacements d'affilée : un seul trajet suffit)
+        field = self._field(cell) if pm > 0 and not just_moved else None
+        if field is not None:
+            destinations = [(d, c) for d, c in field.cells_within(pm) if d != cell and d not in self.occupied]
+            for destination, cost in self._ranked(destinations, pa, casts):
+                damage, pm_saved, pa_saved, actions = self._search(destination, pa, pm - cost, casts, 0, True)
+                best = max(best, (damage, pm_saved - cost, pa_saved, (("move", destination, cost),) + actions),
+                           key=lambda option: option[:3])
+
+        # Sort de mouvement
+        for index, spell in enumerate(self.spells):
+            if not spell.get('is_movement') or spell['cost'] > pa or casts[index] >= max_casts(spell):
+                continue
+            next_casts = casts[:index] + (casts[index] + 1,) + casts[index + 1:]
+            for destination, _ in self._ranked(self._teleport_destinations(cell, spell), pa - spell['cost'], next_casts):
+                damage, pm_saved, pa_saved, actions = self._search(destination, pa - spell['cost'], pm, next_casts, 0, False)
+                best = max(best, (damage, pm_saved, pa_saved - spell['cost'], (("teleport", index, destination),) + actions),
+                           key=lambda option: option[:3])
+
+        self._memo[key] = best
+        return best
+
+    def plan(self, current_pa, current_pm):
+        # Liste d'actions du tour : {"type": "cast" | "move" | "teleport", ...} ; vide si aucune attaque n'est possible
+        self.deadline = time.perf_counter() + self.budget
+        self.is_complete = True
+        damage, _, _, actions = self._search(self.start, current_pa, current_pm, self.start_casts, 0, False)
+        plan = []
+        for action in actions:
+            if action[0] == "cast":
+                plan.append({"type": "cast", "spell": self.spells[action[1]], "target": action[2]})
+            elif action[0] == "move":
+                plan.append({"type": "move", "cell": action[1], "move_cost": action[2]})
+            else:
+                plan.append({"type": "teleport", "spell": self.spells[action[1]], "cell": action[2]})
+        self.damage = damage
+        return plan
+
+def plan_turn(player_pos, monster_positions, spells, current_pa, current_pm, spell_casts, spell_cooldowns, current_turn, budget=TURN_PLAN_BUDGET):
+    planner = TurnPlanner(player_pos, monster_positions, spells, spell_casts, spell_cooldowns, current_turn, budget=budget)
+    plan, damage = planner.plan(current_pa, current_pm), planner.damage
+    if not planner.is_complete:
+        # Recherche interrompue : la position d'attaque simple (un déplacement puis les sorts) sert de plancher
+        option = find_attack_position(player_pos, monster_positions, planner.spells, current_pa, current_pm, spell_casts)
+        if option and option['damage'] > damage:
+            plan = [{"type": "move", "cell": option['cell'], "move_cost": option['move_cost']}] if option['cell'] != player_pos else []
+            ordered = sorted(option['sequence'], key=planner.spells.index)
+            plan += [{"type": "cast", "spell": spell, "target": option['target']} for spell in ordered]
+            damage = option['damage']
+        log(f"[Combat Auto] Budget de planification ({budget:.2f} s) épuisé : meilleur plan trouvé conservé.")
+    return plan, damage
+
+def describe_plan(plan):
+    steps = []
+    for action in plan:
+        if action['type'] == "cast":
+            steps.append(f"{action['spell']['name']} -> {action['target']}")
+        elif action['type'] == "move":
+            steps.append(f"déplacement {action['cell']} ({action['move_cost']} PM)")
+        else:
+            steps.append(f"{action['spell']['name']} -> {action['cell']}")
+    return ", ".join(steps)
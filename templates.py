@@ -0,0 +1,112 @@
+import os
+import glob
+import json
+import threading
+import numpy as np
+import cv2
+
+# --- Constantes ---
+IMAGE_FOLDER = "Images"
+TEMPLATE_BUNDLE_PATH = os.path.join(IMAGE_FOLDER, "templates.npz")
+PYRAMID_LEVELS = 2  # Niveaux réduits (1/2, 1/4) en plus de la pleine résolution
+PYRAMID_MIN_SIZE = 8
+
+class Template:
+    # --- Modèle précompilé : niveaux de gris, taille, pyramide et masque ---
+    def __init__(self, name, gray, mask=None, pyramid=None):
+        self.name = name
+        self.gray = gray
+        self.mask = mask
+        self.h, self.w = gray.shape
+        self.pyramid = pyramid if pyramid else [gray]
+
+def _build_pyramid(gray):
+    pyramid = [gray]
+    for _ in range(PYRAMID_LEVELS):
+        previous = pyramid[-1]
+        if min(previous.shape) // 2 < PYRAMID_MIN_SIZE:
+            break
+        pyramid.append(cv2.pyrDown(previous))
+    return pyramid
+
+def template_name(name_or_path):
+    return os.path.splitext(os.path.basename(name_or_path))[0]
+
+class TemplateRegistry:
+    # --- Registre des images de Images/, chargé une seule fois ---
+    def __init__(self, folder=IMAGE_FOLDER, bundle_path=TEMPLATE_BUNDLE_PATH):
+        self.folder = folder
+        self.bundle_path = bundle_path
+        self.templates = {}
+        self.is_loaded = False
+        self._lock = threading.Lock()
+
+    def _sources(self):
+        return sorted(glob.glob(os.path.join(self.folder, "*.png")))
+
+    def _signature(self, sources):
+        return [[template_name(p), os.path.getmtime(p), os.path.getsize(p)] for p in sources]
+
+    def load(self):
+        with self._lock:
+            sources = self._sources()
+            signature = self._signature(sources)
+            if not self._load_bundle(signature):
+                self._compile(sources)
+                self._save_bundle(signature)
+            self.is_loaded = True
+
+    def _compile(self, sources):
+        self.templates = {}
+        for path in sources:
+            gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+            if gray is None:
+                continue
+            raw = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+            mask = None
+            if raw is not None and raw.ndim == 3 and raw.shape[2] == 4 and np.any(raw[:, :, 3] < 255):
+                mask = np.where(raw[:, :, 3] > 0, 255, 0).astype(np.uint8)
+            name = template_name(path)
+            self.templates[name] = Template(name, gray, mask, _build_pyramid(gray))
+
+    def _load_bundle(self, signature):
+        if not os.path.exists(self.bundle_path):
+            return False
+        try:
+            with np.load(self.bundle_path, allow_pickle=False) as bundle:
+                if json.loads(str(bundle["__signature__"])) != signature:
+                    return False
+                templates = {}
+                for name, _, _ in signature:
+                    if f"{name}/gray" not in bundle:
+                        continue
+                    gray = bundle[f"{name}/gray"]
+                    mask = bundle[f"{name}/mask"] if f"{name}/mask" in bundle else None
+                    levels = int(bundle[f"{name}/levels"])
+                    pyramid = [gray] + [bundle[f"{name}/pyr{i}"] for i in range(1, levels)]
+                    templates[name] = Template(name, gray, mask, pyramid)
+            self.templates = templates
+            return True
+        except Exception:
+            return False
+
+    def _save_bundle(self, signature):
+        arrays = {"__signature__": np.array(json.dumps(signature))}
+        for name, template in self.templates.items():
+            arrays[f"{name}/gray"] = template.gray
+            arrays[f"{name}/levels"] = np.array(len(template.pyramid))
+            for i, level in enumerate(template.pyramid[1:], start=1):
+                arrays[f"{name}/pyr{i}"] = level
+            if template.mask is not None:
+                arrays[f"{name}/mask"] = template.mask
+        try:
+            np.savez(self.bundle_path, **arrays)
+        except OSError:
+            pass
+
+    def get(self, name_or_path):
+        if not self.is_loaded:
+            self.load()
+        return self.templates.get(template_name(name_or_path))
+
+template_registry = TemplateRegistry()
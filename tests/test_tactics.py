@@ -0,0 +1,26 @@
+from grid import grid_instance
+from tactics import plan_turn
+
+PLAYER = (0, 0)
+MONSTER = (1, 0)
+
+def make_spell(name, cost, **extra):
+    spell = {"name": name, "key": "1", "cost": cost, "range_min": 1, "range_max": 3, "requires_los": False}
+    spell.update(extra)
+    return spell
+
+def casts(plan):
+    return [action['spell']['name'] for action in plan if action['type'] == "cast"]
+
+def test_cooldown_spell_cast_once_per_plan():
+    assert PLAYER in grid_instance.cells and MONSTER in grid_instance.cells
+    spells = [make_spell("Frappe", 3, cooldown=2, casts_per_turn=2)]
+    plan, damage = plan_turn(PLAYER, [MONSTER], spells, current_pa=6, current_pm=0, spell_casts={}, spell_cooldowns={}, current_turn=1)
+    assert casts(plan) == ["Frappe"]
+    assert damage == 3
+
+def test_spell_without_cooldown_cast_up_to_limit():
+    spells = [make_spell("Frappe", 3, casts_per_turn=2)]
+    plan, damage = plan_turn(PLAYER, [MONSTER], spells, current_pa=6, current_pm=0, spell_casts={}, spell_cooldowns={}, current_turn=1)
+    assert casts(plan) == ["Frappe", "Frappe"]
+    assert damage == 6
@@ -1,17 +1,20 @@
 import time
 import numpy as np
 import cv2
-from PIL import ImageGrab, Image
+from PIL import Image
 from datetime import datetime
-import pyautogui
-import pytesseract
 import re
 import threading
+from capture import frame_bus
+from templates import template_registry
+from vision import locate_template
+from ocr import coordinate_glyphs, ocr_service, UNKNOWN_GLYPH, COORDINATE_CHARS
 
 
 # --- Constantes ---
 RED_RGB = (204, 0, 0)
 RED_TOLERANCE = 0
+COORDINATES_CROP_BOX = (0, 85, 300, 110)
 
 stop_requested = False
 is_paused = False
@@ -19,6 +22,9 @@ is_paused = False
 # Verrou pour l'accès aux fichiers d'images de carte
 image_file_lock = threading.Lock()
 
+# Lectures Tesseract en attente de confirmation avant d'entraîner les glyphes
+pending_glyph_samples = {}
+
 def set_pause_state(state: bool):
     global is_paused
     is_paused = state
@@ -43,62 +49,86 @@ def log(msg):
     formatted_msg = f"[{datetime.now().strftime('%H:%M:%S')}] {msg}"
     print(formatted_msg)
 
-def get_map_coordinates_single_pass():
+def threshold_coordinate_strip(cropped):
+    return cv2.threshold(cropped.gray, 240, 255, cv2.THRESH_BINARY)[1]
+
+def read_coordinates_with_glyphs(img):
+    # "x,y" lu par les glyphes, "" si la bande est vide, None s'il faut passer par l'OCR
+    if not coordinate_glyphs.knows(COORDINATE_CHARS):
+        return None
+    text = coordinate_glyphs.classify(img)
+    if not text:
+        return ""
+    match = re.search(r'(-?\d+)\s*,\s*(-?\d+)', text)
+    # Un glyphe inconnu collé aux coordonnées pourrait en faire partie : on laisse alors l'OCR trancher
+    if match and UNKNOWN_GLYPH not in text[max(0, match.start() - 1):match.end() + 1]:
+        x, y = match.groups()
+        return f"{x},{y}"
+    return None
+
+def parse_coordinates_text(img, text):
+    match = re.search(r'(-?\d+)\s*,\s*(-?\d+)', text)
+    if match:
+        x, y = match.groups()
+        pending_glyph_samples[f"{x},{y}"] = (img, text)
+        return f"{x},{y}"
+    return None
+
+def get_map_coordinates_single_pass(frame=None):
     # --- OCR pour les coordonnées de la carte ---
-    screenshot = ImageGrab.grab()
-    crop_box = (0, 85, 300, 110)
-    cropped = screenshot.crop(crop_box)
+    cropped = frame.crop(COORDINATES_CROP_BOX) if frame is not None else frame_bus.grab(bbox=COORDINATES_CROP_BOX)
     try:
-        img = cv2.cvtColor(np.array(cropped), cv2.COLOR_RGB2GRAY)
-        img = cv2.threshold(img, 240, 255, cv2.THRESH_BINARY)[1]
-        text = pytesseract.image_to_string(img, config='--psm 6')
-        match = re.search(r'(-?\d+)\s*,\s*(-?\d+)', text)
-        if match:
-            x, y = match.groups()
-            return f"{x},{y}"
+        img = threshold_coordinate_strip(cropped)
+        read = read_coordinates_with_glyphs(img)
+        if read is not None:
+            return read or None
+        return parse_coordinates_text(img, ocr_service.read(255 - img, psm=6))
     except Exception as e:
         pass
     return None
 
-def get_map_coordinates():
-    reads = []
-    for _ in range(3):
+def get_map_coordinates(first_read=None):
+    # first_read : lecture déjà faite (par exemple dans la requête OCR groupée du début de tour)
+    reads = [first_read] if first_read else []
+    passes = len(reads)
+    while passes < 3:
         read = get_map_coordinates_single_pass()
+        passes += 1
         if read:
             reads.append(read)
-        time.sleep(0.1)
-    
-    if not reads:
-        return None
-
-    counts = {item: reads.count(item) for item in set(reads)}
-    if max(counts.values()) >= 2:
-        return max(counts, key=counts.get)
-    
+            # Arrêt dès que deux lectures concordent
+            if reads.count(read) >= 2:
+                sample = pending_glyph_samples.get(read)
+                if sample:
+                    coordinate_glyphs.learn(*sample)
+                pending_glyph_samples.clear()
+                return read
+        if passes < 3:
+            time.sleep(0.1)
+
+    pending_glyph_samples.clear()
     return None
 
-def is_red_present(x, y, size=10, target_color=RED_RGB, tolerance=30, min_pixels=5):
+def is_red_present(x, y, size=10, target_color=RED_RGB, tolerance=30, min_pixels=5, frame=None):
     box = (x - size, y - size, x + size, y + size)
-    img = ImageGrab.grab(bbox=box)
-    img_np = np.array(img)
+    zone = frame.crop(box) if frame is not None else frame_bus.grab(bbox=box)
+    img_np = zone.array.astype(np.int16)
     diff = np.abs(img_np - target_color)
     mask = np.all(diff <= tolerance, axis=-1)
     count = np.count_nonzero(mask)
     return count >= min_pixels
 
-def check_and_close_levelup_popup(template_path="Images/button_ok.png", threshold=0.8):
+def check_and_close_levelup_popup(template_path="Images/button_ok.png", threshold=0.8, frame=None):
+    import pyautogui
     try:
-        template = cv2.imread(template_path, 0)
+        template = template_registry.get(template_path)
         if template is None:
             return False
-        w, h = template.shape[::-1]
-        screen = ImageGrab.grab()
-        screen_gray = cv2.cvtColor(np.array(screen), cv2.COLOR_BGR2GRAY)
-        res = cv2.matchTemplate(screen_gray, template, cv2.TM_CCOEFF_NORMED)
-        loc = np.where(res >= threshold)
-        for pt in zip(*loc[::-1]):
-            pyautogui.moveTo(pt[0] + w // 2, pt[1] + h // 2, duration=0.2)
+        match = locate_template(template, threshold, frame=frame)
+        if match:
+            pyautogui.moveTo(match[0] + template.w // 2, match[1] + template.h // 2, duration=0.2)
             pyautogui.click()
+            frame_bus.invalidate()
             log("Popup métier détecté : clic sur OK.")
             return True
         return False
@@ -106,34 +136,31 @@ def check_and_close_levelup_popup(template_path="Images/button_ok.png", threshol
         log(f"Erreur lors de la recherche du bouton '{template_path}': {e}")
         return False
 
-def check_and_close_fight_end_popup(template_path="Images/button_X.png", threshold=0.8):
+def check_and_close_fight_end_popup(template_path="Images/button_X.png", threshold=0.8, frame=None):
+    import pyautogui
     try:
-        template = cv2.imread(template_path, 0)
+        template = template_registry.get(template_path)
         if template is None: return False
-        w, h = template.shape[::-1]
-        screen = ImageGrab.grab()
-        screen_gray = cv2.cvtColor(np.array(screen), cv2.COLOR_BGR2GRAY)
-        res = cv2.matchTemplate(screen_gray, template, cv2.TM_CCOEFF_NORMED)
-        loc = np.where(res >= threshold)
-        if len(loc[0]) > 0:
-            pyautogui.moveTo(loc[1][0] + w // 2, loc[0][0] + h // 2, duration=0.2)
+        match = locate_template(template, threshold, frame=frame)
+        if match:
+            pyautogui.moveTo(match[0] + template.w // 2, match[1] + template.h // 2, duration=0.2)
             pyautogui.click()
+            frame_bus.invalidate()
             log("Fin de combat détectée : clic sur le bouton pour fermer.")
             return True
     except Exception as e:
         log(f"Erreur lors de la recherche du bouton '{template_path}': {e}")
         return False
 
-def is_fight_started(template_path="Images/button_ready.png", threshold=0.8, checks=2, interval=0.1):
+def is_fight_started(template_path="Images/button_ready.png", threshold=0.8, checks=2, interval=0.1, frame=None, pyramid=False):
     try:
-        template = cv2.imread(template_path, 0)
+        template = template_registry.get(template_path)
         if template is None:
             return False
         for i in range(checks):
-            screen = ImageGrab.grab()
-            screen_gray = cv2.cvtColor(np.array(screen), cv2.COLOR_RGB2GRAY)
-            res = cv2.matchTemplate(screen_gray, template, cv2.TM_CCOEFF_NORMED)
-            if np.any(res >= threshold):
+            # La première vérification réutilise la capture du tick, les suivantes exigent une nouvelle capture
+            screen = frame if (i == 0 and frame is not None) else frame_bus.grab(max_age=None if i == 0 else 0)
+            if locate_template(template, threshold, frame=screen, pyramid=pyramid):
                 return True
             if i < checks - 1:
                 time.sleep(interval)
@@ -0,0 +1,212 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import cv2
+from capture import frame_bus
+
+# --- Constantes ---
+CONFIG_PATH = "config.json"
+LEARNED_POSITIONS_KEY = "LEARNED_POSITIONS"
+LEARNED_SEARCH_MARGIN = 40  # Marge (px) autour de la dernière position connue
+LEARNED_MOVE_TOLERANCE = 3  # Déplacement minimal (px) avant réécriture de config.json
+PYRAMID_COARSE_MARGIN = 0.15  # Seuil abaissé au niveau réduit pour ne manquer aucun candidat
+PYRAMID_MIN_TEMPLATE_SIDE = 12  # Taille minimale du modèle réduit pour rester discriminant
+PYRAMID_MAX_CANDIDATES = 16
+PYRAMID_REFINE_PADDING = 4
+ENTITY_NMS_DISTANCE = 30  # Deux détections plus proches (sur chaque axe) sont fusionnées
+
+_match_executor = ThreadPoolExecutor(max_workers=4)
+
+def _clip_bbox(bbox, bounds):
+    return (max(bbox[0], bounds[0]), max(bbox[1], bounds[1]),
+            min(bbox[2], bounds[2]), min(bbox[3], bounds[3]))
+
+# --- Positions apprises des boutons ---
+class LearnedPositions:
+    def __init__(self, config_path=CONFIG_PATH):
+        self.config_path = config_path
+        self.positions = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.config_path, 'r') as f:
+                config = json.load(f)
+            self.positions = {name: tuple(pos) for name, pos in config.get(LEARNED_POSITIONS_KEY, {}).items() if len(pos) == 2}
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.positions = {}
+
+    def window(self, template, margin=LEARNED_SEARCH_MARGIN):
+        center = self.positions.get(template.name)
+        if not center:
+            return None
+        half_w, half_h = template.w // 2 + margin, template.h // 2 + margin
+        return (max(0, center[0] - half_w), max(0, center[1] - half_h), center[0] + half_w, center[1] + half_h)
+
+    def record(self, template, center):
+        previous = self.positions.get(template.name)
+        if previous and abs(previous[0] - center[0]) <= LEARNED_MOVE_TOLERANCE and abs(previous[1] - center[1]) <= LEARNED_MOVE_TOLERANCE:
+            return
+        self.positions[template.name] = (int(center[0]), int(center[1]))
+        self.save()
+
+    def save(self):
+        with self._lock:
+            try:
+                with open(self.config_path, 'r') as f:
+                    config = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                config = {}
+            config[LEARNED_POSITIONS_KEY] = {name: list(pos) for name, pos in self.positions.items()}
+            with open(self.config_path, 'w') as f:
+                json.dump(config, f, indent=4)
+
+learned_positions = LearnedPositions()
+
+# --- Recherche de modèles ---
+def match_template(template, threshold=0.8, frame=None, bbox=None):
+    # Renvoie (x, y, score) du premier coin haut-gauche au-dessus du seuil, en coordonnées écran
+    if frame is None:
+        frame = frame_bus.grab(bbox=bbox)
+    elif bbox is not None:
+        frame = frame.crop(_clip_bbox(bbox, frame.bbox))
+
+    screen_gray = frame.gray
+    if screen_gray.shape[0] < template.h or screen_gray.shape[1] < template.w:
+        return None
+    res = cv2.matchTemplate(screen_gray, template.gray, cv2.TM_CCOEFF_NORMED)
+    loc = np.where(res >= threshold)
+    if len(loc[0]) == 0:
+        return None
+    y, x = loc[0][0], loc[1][0]
+    offset_x, offset_y = frame.offset
+    return (int(x) + offset_x, int(y) + offset_y, float(res[y, x]))
+
+def _pyramid_level(template, max_level):
+    level = 0
+    for i in range(1, min(len(template.pyramid) - 1, max_level) + 1):
+        if min(template.pyramid[i].shape) >= PYRAMID_MIN_TEMPLATE_SIDE:
+            level = i
+    return level
+
+def match_template_pyramid(template, threshold=0.8, frame=None, bbox=None, max_level=2, coarse_margin=PYRAMID_COARSE_MARGIN):
+    # Candidats sur l'image réduite, confirmation à pleine résolution : mêmes coordonnées que match_template
+    if frame is None:
+        frame = frame_bus.grab(bbox=bbox)
+    elif bbox is not None:
+        frame = frame.crop(_clip_bbox(bbox, frame.bbox))
+
+    level = _pyramid_level(template, max_level)
+    if level == 0:
+        return match_template(template, threshold, frame=frame)
+
+    coarse_screen = frame.gray_level(level)
+    coarse_template = template.pyramid[level]
+    if coarse_screen.shape[0] < coarse_template.shape[0] or coarse_screen.shape[1] < coarse_template.shape[1]:
+        return match_template(template, threshold, frame=frame)
+
+    coarse_res = cv2.matchTemplate(coarse_screen, coarse_template, cv2.TM_CCOEFF_NORMED)
+    peaks = (coarse_res >= threshold - coarse_margin) & (coarse_res == cv2.dilate(coarse_res, np.ones((3, 3), np.uint8)))
+    ys, xs = np.nonzero(peaks)
+    if len(ys) == 0:
+        return None
+    if len(ys) > PYRAMID_MAX_CANDIDATES:
+        best = np.argpartition(coarse_res[ys, xs], -PYRAMID_MAX_CANDIDATES)[-PYRAMID_MAX_CANDIDATES:]
+        ys, xs = ys[best], xs[best]
+
+    screen_gray = frame.gray
+    scale = 2 ** level
+    reach = scale + PYRAMID_REFINE_PADDING
+    best_match = None
+    for cy, cx in zip(ys, xs):
+        x0, y0 = max(0, cx * scale - reach), max(0, cy * scale - reach)
+        x1 = min(screen_gray.shape[1], cx * scale + reach + template.w)
+        y1 = min(screen_gray.shape[0], cy * scale + reach + template.h)
+        if y1 - y0 < template.h or x1 - x0 < template.w:
+            continue
+        res = cv2.matchTemplate(screen_gray[y0:y1, x0:x1], template.gray, cv2.TM_CCOEFF_NORMED)
+        loc = np.where(res >= threshold)
+        if len(loc[0]) == 0:
+            continue
+        # Premier point en ordre ligne par ligne, comme np.where sur l'écran entier
+        candidate = (int(loc[0][0]) + y0, int(loc[1][0]) + x0, float(res[loc[0][0], loc[1][0]]))
+        if best_match is None or candidate[:2] < best_match[:2]:
+            best_match = candidate
+
+    if best_match is None:
+        return None
+    offset_x, offset_y = frame.offset
+    y, x, score = best_match
+    return (x + offset_x, y + offset_y, score)
+
+def locate_template(template, threshold=0.8, frame=None, margin=LEARNED_SEARCH_MARGIN, pyramid=False):
+    # Fenêtre apprise d'abord, plein écran seulement en cas d'échec
+    window = learned_positions.window(template, margin)
+    match = match_template(template, threshold, frame=frame, bbox=window) if window else None
+    if match is None:
+        full_screen_matcher = match_template_pyramid if pyramid else match_template
+        match = full_screen_matcher(template, threshold, frame=frame)
+    if match is not None:
+        learned_positions.record(template, (match[0] + template.w // 2, match[1] + template.h // 2))
+    return match
+
+# --- Recherche groupée de plusieurs modèles ---
+def _template_peaks(screen_gray, template, threshold):
+    res = cv2.matchTemplate(screen_gray, template, cv2.TM_CCOEFF_NORMED)
+    peaks = (res >= threshold) & (res == cv2.dilate(res, np.ones((3, 3), np.uint8)))
+    ys, xs = np.nonzero(peaks)
+    h, w = template.shape
+    return np.stack([xs + w // 2, ys + h // 2], axis=1), res[ys, xs]
+
+def non_max_suppression(centers, scores, distance=ENTITY_NMS_DISTANCE):
+    # Suppression gloutonne par score décroissant, boîte carrée de côté 2 * distance
+    order = np.argsort(-scores, kind='stable')
+    centers, scores = centers[order], scores[order]
+    remaining = np.ones(len(centers), dtype=bool)
+    kept = []
+    for i in range(len(centers)):
+        if not remaining[i]:
+            continue
+        kept.append(i)
+        close = np.all(np.abs(centers - centers[i]) < distance, axis=1)
+        remaining &= ~close
+    return centers[kept], scores[kept]
+
+def match_templates_batched(screen_gray, templates, threshold=0.8, distance=ENTITY_NMS_DISTANCE):
+    # Tous les modèles en parallèle sur la même image grise, puis fusion des pics
+    templates = [t for t in templates if t is not None and t.shape[0] <= screen_gray.shape[0] and t.shape[1] <= screen_gray.shape[1]]
+    if not templates:
+        return np.empty((0, 2), dtype=int), np.empty(0, dtype=np.float32)
+    results = list(_match_executor.map(lambda t: _template_peaks(screen_gray, t, threshold), templates))
+    centers = np.concatenate([c for c, _ in results])
+    scores = np.concatenate([s for _, s in results])
+    if len(centers) == 0:
+        return centers, scores
+    return non_max_suppression(centers, scores, distance)
+
+# --- Sondes de couleur sur des disques de pixels ---
+_disk_offsets_cache = {}
+
+def disk_offsets(radius):
+    if radius not in _disk_offsets_cache:
+        dy, dx = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+        inside = dx ** 2 + dy ** 2 <= radius ** 2
+        _disk_offsets_cache[radius] = (dx[inside], dy[inside])
+    return _disk_offsets_cache[radius]
+
+def count_color_hits(image_array, centers, colors_rgb, tolerance=20, radius=10):
+    # Nombre de pixels proches d'une des couleurs dans le disque autour de chaque centre (coordonnées de l'image)
+    centers = np.asarray(centers, dtype=np.int64).reshape(-1, 2)
+    if len(centers) == 0 or len(colors_rgb) == 0:
+        return np.zeros(len(centers), dtype=np.int64)
+    dx, dy = disk_offsets(radius)
+    xs = centers[:, 0:1] + dx[None, :]
+    ys = centers[:, 1:2] + dy[None, :]
+    height, width = image_array.shape[:2]
+    inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+    pixels = image_array[np.clip(ys, 0, height - 1), np.clip(xs, 0, width - 1), :3].astype(np.int16)
+    colors = np.asarray(colors_rgb, dtype=np.int16).reshape(1, 1, -1, 3)
+    hits = np.any(np.all(np.abs(pixels[:, :, None, :] - colors) <= tolerance, axis=-1), axis=-1)
+    return np.count_nonzero(hits & inside, axis=1)
@@ -0,0 +1,207 @@
+import os
+import heapq
+import threading
+from utils import log
+from map_store import map_store, parse_override_cell, neighbour_coords
+
+# --- Constantes ---
+WORLD_POLL_INTERVAL = 2.0  # Intervalle (s) de vérification des fichiers de cartes
+MAP_CHANGE_SECONDS = 8.0  # Coût estimé d'un changement de carte
+SPOT_SECONDS = 10.0  # Temps estimé passé sur un point de pêche
+
+class WorldGraph:
+    # --- Graphe des cartes : chargées une seule fois depuis la base, rechargées quand un fichier Maps/*.json change ---
+    def __init__(self):
+        self.maps = {}  # coordonnées -> données de la carte (format JSON)
+        self.edges = {}  # coordonnées -> {direction: coordonnées voisines}
+        self.overrides = {}  # coordonnées -> {(q, r): état} (combat_overrides déjà convertis)
+        self._json_mtimes = {}  # coordonnées -> date du fichier JSON correspondant aux données en mémoire
+        self.is_loaded = False
+        self._listeners = []
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._watcher = None
+
+    def _load_map(self, coords):
+        data = map_store.get_map(coords)
+        if data is None:
+            self._remove_map(coords)
+            return
+        self.maps[coords] = data
+        self.edges[coords] = {direction: neighbour_coords(coords, direction) for direction in data.get("exits", {})}
+        self.overrides[coords] = {parse_override_cell(cell): state for cell, state in data.get("combat_overrides", {}).items()}
+        self._json_mtimes[coords] = map_store.json_mtime(coords)
+
+    def _remove_map(self, coords):
+        self.maps.pop(coords, None)
+        self.edges.pop(coords, None)
+        self.overrides.pop(coords, None)
+        self._json_mtimes.pop(coords, None)
+
+    def _json_file_mtime(self, coords):
+        try:
+            return os.path.getmtime(os.path.join(map_store.folder, f"{coords}.json"))
+        except OSError:
+            return None
+
+    def _validate(self, coords):
+        # Un stat par accès : un fichier JSON modifié depuis le chargement est réimporté sans attendre la surveillance
+        self._ensure_loaded()
+        mtime = self._json_file_mtime(coords)
+        if mtime is None or mtime == self._json_mtimes.get(coords):
+            return
+        self.scan()
+        with self._lock:
+            if coords in self.maps:
+                self._json_mtimes[coords] = mtime
+
+    def scan(self):
+        # Importe dans la base les fichiers nouveaux ou modifiés, puis recharge les cartes touchées ; renvoie leurs coordonnées
+        with self._lock:
+            changed = map_store.import_json()
+            if not self.is_loaded:
+                changed |= set(map_store.map_coords())
+            for coords in changed:
+                self._load_map(coords)
+            if not self.is_loaded:
+                log(f"[Monde] {len(self.maps)} cartes chargées depuis {map_store.db_path}.")
+            self.is_loaded = True
+        if changed:
+            self._notify(changed)
+        return changed
+
+    def refresh(self, coords):
+        # À appeler par tout code qui modifie une carte dans la base : mise à jour immédiate, sans attendre la surveillance
+        with self._lock:
+            self._load_map(coords)
+        self._notify({coords})
+
+    def add_listener(self, callback):
+        # callback(ensemble de coordonnées modifiées), appelé depuis le thread qui a détecté le changement
+        self._listeners.append(callback)
+
+    def _notify(self, changed):
+        for callback in self._listeners:
+            try:
+                callback(changed)
+            except Exception as e:
+                log(f"[Monde] Erreur dans un abonné aux changements de cartes : {e}")
+
+    def start_watching(self, interval=WORLD_POLL_INTERVAL):
+        if self._watcher and self._watcher.is_alive():
+            return
+        self._ensure_loaded()
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch, args=(interval,), daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self):
+        self._stop.set()
+
+    def _watch(self, interval):
+        while not self._stop.wait(interval):
+            self.scan()
+
+    def _ensure_loaded(self):
+        if not self.is_loaded:
+            self.scan()
+
+    # --- Requêtes (un seul stat du fichier JSON, aucune lecture) ---
+    def has_map(self, coords):
+        self._validate(coords)
+        return coords in self.maps
+
+    def get_map(self, coords):
+        # Données partagées : copier avant de modifier
+        self._validate(coords)
+        return self.maps.get(coords)
+
+    def get_overrides(self, coords):
+        # Remplacements de combat de la carte, clés (q, r) ; dictionnaire partagé, ne pas modifier
+        self._validate(coords)
+        return self.overrides.get(coords, {})
+
+    def neighbours(self, coords):
+        # Directions de sortie menant à une carte connue
+        self._ensure_loaded()
+        with self._lock:
+            return {direction: target for direction, target in self.edges.get(coords, {}).items() if target in self.maps}
+
+world_graph = WorldGraph()
+
+class TourPlanner:
+    # --- Tournée de session sur le graphe des cartes : cartes choisies selon points de pêche gagnés / temps de trajet ---
+    def __init__(self, graph):
+        self.graph = graph
+        self.route = []  # Cartes à parcourir, la première étant la carte courante
+        self.visited = set()
+        self.is_dirty = True
+        graph.add_listener(self._on_maps_changed)
+
+    def _on_maps_changed(self, changed):
+        self.is_dirty = True
+
+    def shortest_paths(self, start):
+        # Dijkstra sur les sorties (arcs orientés), coût MAP_CHANGE_SECONDS par changement de carte
+        distances, previous = {start: 0.0}, {}
+        queue = [(0.0, start)]
+        while queue:
+            distance, coords = heapq.heappop(queue)
+            if distance > distances[coords]:
+                continue
+            for target in self.graph.neighbours(coords).values():
+                candidate = distance + MAP_CHANGE_SECONDS
+                if candidate < distances.get(target, float('inf')):
+                    distances[target] = candidate
+                    previous[target] = coords
+                    heapq.heappush(queue, (candidate, target))
+        return distances, previous
+
+    def _spots(self, coords):
+        return len((self.graph.get_map(coords) or {}).get("cells", []))
+
+    def plan(self, start):
+        # Glouton : à chaque étape, la carte qui rapporte le plus de points par seconde, trajet compris
+        route, visited, current = [start], set(self.visited) | {start}, start
+        while True:
+            distances, previous = self.shortest_paths(current)
+            best, best_path, best_score = None, None, 0.0
+            for target, distance in distances.items():
+                if target in visited or self._spots(target) == 0:
+                    continue
+                path = [target]
+                while path[-1] != current:
+                    path.append(previous[path[-1]])
+                path = path[::-1][1:]
+                gained = sum(self._spots(coords) for coords in set(path) - visited)
+                score = gained / (distance + gained * SPOT_SECONDS)
+                if score > best_score or (score == best_score and best is not None and target < best):
+                    best, best_path, best_score = target, path, score
+            if best is None:
+                break
+            route.extend(best_path)
+            visited.update(best_path)
+            current = best
+        return route
+
+    def next_direction(self, coords):
+        # Direction de sortie vers l'étape suivante ; nouvelle planification si la carte courante n'est pas celle prévue
+        self.visited.add(coords)
+        if self.is_dirty or len(self.route) < 2 or self.route[0] != coords:
+            self.route = self.plan(coords)
+            if len(self.route) < 2:
+                # Tournée terminée : nouveau tour depuis la carte courante
+                self.visited = {coords}
+                self.route = self.plan(coords)
+            self.is_dirty = False
+            if len(self.route) > 1:
+                log(f"[Trajet] Tournée planifiée : {' -> '.join(self.route)}.")
+        if len(self.route) < 2:
+            # Aucune carte avec des points atteignable : première sortie connue, comme avant la planification
+            return next(iter(self.graph.neighbours(coords)), None)
+
+        next_coords = self.route[1]
+        self.route = self.route[1:]
+        return next((direction for direction, target in self.graph.neighbours(coords).items() if target == next_coords), None)
+
+tour_planner = TourPlanner(world_graph)